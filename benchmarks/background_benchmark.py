@@ -0,0 +1,179 @@
+# background_benchmark.py
+#
+# Copyright 2026 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Startup time and memory of the background service against a full window, needs a running session
+# and no other Rewaita instance:
+#   python3 benchmarks/background_benchmark.py --repeat 5 --json bench.json
+# "window" is what --background used to keep resident, it built the whole window and only hid it.
+# "window-eager" runs the installed launcher with its window patched to build the Custom and Fine Tune pages upfront,
+# against "window" that is what the lazy pages save in time to idle (roughly the first frame) and in RSS.
+# For a Flatpak install pass --command "flatpak run io.github.swordpuffin.rewaita", memory is summed over the process tree.
+
+import argparse, json, os, shlex, shutil, statistics, subprocess, sys, time
+
+app_id = "io.github.swordpuffin.rewaita"
+flatpak_launcher = "/app/bin/rewaita"
+modes = {
+    "background": ["--background"],
+    "window": [],
+    "window-eager": [],
+}
+
+# Sets up paths and gettext through the launcher itself, then starts the app with the pages built like before they were lazy
+eager_bootstrap = """
+import os, sys, runpy
+from gi.repository import Gio
+launcher = runpy.run_path(sys.argv[1], run_name="launcher")
+sys.argv = sys.argv[1:]
+Gio.Resource.load(os.path.join(launcher["pkgdatadir"], "rewaita.gresource"))._register()
+from rewaita import main, window
+lazy_init = window.RewaitaWindow.__init__
+def eager_init(self, **kwargs):
+    lazy_init(self, **kwargs)
+    stack = self.switcher.get_stack()
+    for name in ["custom", "pref"]:
+        stack.get_child_by_name(name).set_child(self.build_page(name))
+window.RewaitaWindow.__init__ = eager_init
+sys.exit(main.main(launcher["VERSION"]))
+"""
+
+def eager_command(command):
+    if(command[0] == "flatpak"):
+        return command[:-1] + ["--command=python3", command[-1], "-c", eager_bootstrap, flatpak_launcher]
+    launcher = shutil.which(command[0]) or command[0]
+    with open(launcher) as f:
+        python = f.readline()[2:].strip() # The launcher's own interpreter, it has the gi bindings
+    return [python, "-c", eager_bootstrap, launcher]
+
+def mode_command(command, mode):
+    return (eager_command(command) if mode == "window-eager" else command) + modes[mode]
+
+def app_running():
+    result = subprocess.run(["gdbus", "call", "--session", "--dest", "org.freedesktop.DBus",
+                             "--object-path", "/org/freedesktop/DBus", "--method", "org.freedesktop.DBus.NameHasOwner", app_id],
+                            capture_output=True, text=True)
+    return "true" in result.stdout
+
+def process_tree(pid):
+    children = {}
+    for entry in os.listdir("/proc"):
+        if(not entry.isdigit()):
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    pids, stack = [], [pid]
+    while(stack):
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+def status_kb(pid, field):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if(line.startswith(field + ":")):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+def cpu_ticks(pids):
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            total += int(fields[11]) + int(fields[12])
+        except (OSError, IndexError, ValueError):
+            pass
+    return total
+
+def run_once(command, settle, timeout):
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        registered = None
+        while(registered is None):
+            if(time.perf_counter() - start > timeout):
+                raise TimeoutError(f"{app_id} did not start within {timeout}s")
+            if(app_running()):
+                registered = time.perf_counter() - start
+            else:
+                time.sleep(0.01)
+
+        # Idle once the tree has used no CPU for the whole settle window
+        ticks, idle_since = cpu_ticks(process_tree(process.pid)), time.perf_counter()
+        while(time.perf_counter() - idle_since < settle):
+            time.sleep(0.05)
+            current = cpu_ticks(process_tree(process.pid))
+            if(current != ticks):
+                ticks, idle_since = current, time.perf_counter()
+        idle = idle_since - start
+
+        pids = process_tree(process.pid)
+        return {
+            "registered_s": registered,
+            "idle_s": idle,
+            "rss_mb": sum(status_kb(pid, "VmRSS") for pid in pids) / 1024,
+            "peak_rss_mb": sum(status_kb(pid, "VmHWM") for pid in pids) / 1024,
+        }
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        while(app_running()):
+            time.sleep(0.05)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the background service with a full window, and lazy pages with eager ones")
+    parser.add_argument("--command", default="rewaita", help="how to launch Rewaita")
+    parser.add_argument("--modes", default=",".join(modes), help="comma separated modes")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--settle", type=float, default=1.0, help="seconds without CPU use that count as started")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    if(app_running()):
+        sys.exit(f"{app_id} is already running, quit it first")
+
+    command = shlex.split(args.command)
+    results = []
+    print(f"{'mode':<14}{'registered s':>14}{'idle s':>10}{'RSS MB':>10}{'peak MB':>10}")
+    for mode in args.modes.split(","):
+        runs = [run_once(mode_command(command, mode), args.settle, args.timeout) for _i in range(args.repeat)]
+        result = {"mode": mode, "runs": runs}
+        for key in ["registered_s", "idle_s", "rss_mb", "peak_rss_mb"]:
+            result[key] = statistics.median(run[key] for run in runs)
+        results.append(result)
+        print(f"{mode:<14}{result['registered_s']:>14.3f}{result['idle_s']:>10.3f}{result['rss_mb']:>10.1f}{result['peak_rss_mb']:>10.1f}")
+
+    if(args.json):
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == "__main__":
+    main()
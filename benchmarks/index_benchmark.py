@@ -0,0 +1,98 @@
+# index_benchmark.py
+#
+# Copyright 2026 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Cold start cost of reading a theme library, run from the repository root:
+#   python3 benchmarks/index_benchmark.py --themes 10,100,5000 --json bench.json
+# "parse" is the old startup, every theme file parsed on every launch. "index cold" builds the index
+# from nothing (the first launch) and "index warm" is every launch after that. Each case runs in a fresh interpreter.
+
+import argparse, json, os, shutil, sys, tempfile, time
+import multiprocessing as mp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from src.theme_model import ThemeModel
+from src.theme_index import ThemeIndex
+
+themes_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "themes")
+
+def make_library(theme_dir, count):
+    # The bundled themes copied round robin under unique names
+    sources = [os.path.join(themes_dir, theme_type, name) for theme_type in ["light", "dark"] for name in sorted(os.listdir(os.path.join(themes_dir, theme_type)))]
+    os.makedirs(theme_dir)
+    for i in range(count):
+        shutil.copyfile(sources[i % len(sources)], os.path.join(theme_dir, f"Theme {i:05d}.css"))
+
+def parse_all(theme_dir, index_path):
+    for theme in os.listdir(theme_dir):
+        ThemeModel.load(os.path.join(theme_dir, theme)).colors
+
+def scan_index(theme_dir, index_path):
+    index = ThemeIndex(index_path)
+    index.scan(theme_dir)
+    index.save()
+
+cases = {
+    "parse": parse_all,
+    "index cold": scan_index,
+    "index warm": scan_index,
+}
+
+def run_case(case, theme_dir, index_path, queue):
+    start = time.perf_counter()
+    cases[case](theme_dir, index_path)
+    queue.put(time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark reading the theme library with and without the index")
+    parser.add_argument("--themes", default="10,100,5000", help="comma separated library sizes")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, the fastest is kept")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    results = []
+    print(f"{'themes':>8}{'parse s':>10}{'index cold s':>14}{'index warm s':>14}{'index KB':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in (int(n) for n in args.themes.split(",")):
+            theme_dir = os.path.join(tmp, f"library-{count}")
+            index_path = os.path.join(tmp, f"index-{count}.json")
+            make_library(theme_dir, count)
+
+            result = {"themes": count}
+            for case in cases:
+                times = []
+                for _i in range(args.repeat):
+                    if(case == "index cold" and os.path.exists(index_path)):
+                        os.remove(index_path)
+                    queue = ctx.Queue()
+                    process = ctx.Process(target=run_case, args=(case, theme_dir, index_path, queue))
+                    process.start()
+                    times.append(queue.get())
+                    process.join()
+                result[case] = min(times)
+            result["index_kb"] = os.path.getsize(index_path) / 1024
+            results.append(result)
+            print(f"{count:>8}{result['parse']:>10.3f}{result['index cold']:>14.3f}{result['index warm']:>14.3f}{result['index_kb']:>10.0f}")
+
+    if(args.json):
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# template_benchmark.py
+#
+# Copyright 2026 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Times the per-apply template rendering, str.replace passes against the compiled templates, run from the repository root:
+#   python3 benchmarks/template_benchmark.py --repeat 200 --json bench.json
+
+import argparse, json, os, re, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from src.css_template import CssTemplate
+
+themes_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "themes")
+
+# Mirrors utils.template_colors, utils itself needs a display to import
+template_colors = ["window-bg-color", "window-fg-color", "card-bg-color", "headerbar-bg-color",
+                   "accent-color", "border-color", "red-1", "panel-bg-color", "panel-fg-color",
+                   "overview-bg-color", "search-fg-color", "accent-transparent", "accent-fg-color"]
+
+def theme_colors(theme_file):
+    # Same parse and derived colors as on_theme_selected and parse_gtk_theme
+    color_pattern = r'--([a-z0-9-]+)\s*:\s*(#[a-fA-F0-9]+|[a-z0-9_-]+(?:\([^)]*\))?)\s*;'
+    colors = dict(re.findall(color_pattern, open(theme_file).read()))
+    colors["accent-color"] = colors["blue-1"]
+    colors["accent-fg-color"] = "#EEEEEE"
+    colors["border-color"] = "transparent"
+    colors["overview-bg-color"] = colors["window-bg-color"]
+    colors["search-fg-color"] = colors["window-fg-color"]
+    colors["panel-bg-color"] = colors["window-bg-color"]
+    colors["panel-fg-color"] = colors["window-fg-color"]
+    colors["accent-transparent"] = "rgba(98, 114, 164, 0.5)"
+    return colors
+
+def replace_render(gtk3_css, shell_css, colors):
+    for color in colors.keys():
+        gtk3_css = gtk3_css.replace(f"@{color}", colors[color])
+    for item in template_colors:
+        shell_css = shell_css.replace(f"@{item}", colors[item])
+    return gtk3_css, shell_css
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the GTK3 and GNOME Shell template rendering")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    gtk3_css = open(os.path.join(themes_dir, "gtk3-template", "gtk.css")).read()
+    shell_css = open(os.path.join(themes_dir, "gnome-shell-template.css")).read()
+
+    start = time.perf_counter()
+    gtk3_template = CssTemplate(gtk3_css, template_colors, "gtk.css")
+    shell_template = CssTemplate(shell_css, template_colors, "gnome-shell-template.css")
+    compile_time = time.perf_counter() - start
+
+    results = []
+    print(f"compiled both templates once in {compile_time * 1000:.2f} ms")
+    print(f"{'theme':<32}{'replace ms':>12}{'compiled ms':>13}{'speedup':>9}{'same':>6}")
+    for theme_type in ["light", "dark"]:
+        for name in sorted(os.listdir(os.path.join(themes_dir, theme_type))):
+            colors = theme_colors(os.path.join(themes_dir, theme_type, name))
+            old_time, old = timed(lambda: replace_render(gtk3_css, shell_css, colors), args.repeat)
+            new_time, new = timed(lambda: (gtk3_template.render(colors), shell_template.render(colors)), args.repeat)
+            label = os.path.splitext(name)[0].encode("ascii", "ignore").decode().strip()
+            results.append({"theme": f"{theme_type}/{label}", "replace_ms": old_time * 1000, "compiled_ms": new_time * 1000, "identical": old == new})
+            print(f"{theme_type + '/' + label:<32}{old_time * 1000:>12.3f}{new_time * 1000:>13.3f}{old_time / new_time:>8.1f}x{str(old == new):>6}")
+
+    if(args.json):
+        with open(args.json, "w") as f:
+            json.dump({"compile_ms": compile_time * 1000, "themes": results}, f, indent=4)
+
+if __name__ == "__main__":
+    main()
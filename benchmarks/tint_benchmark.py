@@ -0,0 +1,163 @@
+# tint_benchmark.py
+#
+# Copyright 2026 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Times the wallpaper tint engine without a GTK stack, run from the repository root:
+#   python3 benchmarks/tint_benchmark.py --megapixels 1,4 --json bench.json
+# --check only measures the error of the LUT labels against exact labels on a fixed image, and exits 1 above the bounds:
+#   python3 benchmarks/tint_benchmark.py --check
+
+import argparse, json, os, resource, sys, tempfile, time
+import multiprocessing as mp
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from src import tint_engine
+
+palette = ["#2e3440", "#3b4252", "#d8dee9", "#88c0d0", "#81a1c1", "#5e81ac", "#bf616a", "#d08770", "#ebcb8b", "#a3be8c", "#b48ead"]
+screenshot_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "screenshots")
+
+def size_for(megapixels):
+    width = int(round((megapixels * 1e6 * 16 / 9) ** 0.5))
+    return width, int(round(width * 9 / 16))
+
+def gradient_image(width, height, rng):
+    # Photo-like smooth color fields with sensor noise
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    x /= width; y /= height
+    arr = np.stack([x * 255, y * 255, (np.sin(x * 9) * 0.5 + 0.5) * 255], axis=-1)
+    arr += rng.normal(0, 6, (height, width, 3)).astype(np.float32)
+    return np.clip(arr, 0, 255).astype(np.uint8)
+
+def flat_image(width, height, rng):
+    # Flat vector art, a handful of colors in large blocks
+    colors = rng.integers(0, 256, (12, 3), dtype=np.uint8)
+    blocks = rng.integers(0, len(colors), (max(1, height // 64), max(1, width // 64)))
+    index = np.repeat(np.repeat(blocks, 64, axis=0), 64, axis=1)
+    index = np.pad(index, ((0, max(0, height - index.shape[0])), (0, max(0, width - index.shape[1]))), mode="edge")
+    return colors[index[:height, :width]]
+
+def screenshot_image(width, height, rng):
+    # The bundled screenshots, scaled to the requested size
+    names = sorted(name for name in os.listdir(screenshot_dir) if name.endswith(".png"))
+    img = Image.open(os.path.join(screenshot_dir, names[rng.integers(len(names))])).convert("RGB")
+    return np.asarray(img.resize((width, height), Image.BILINEAR))
+
+kinds = {
+    "gradient": gradient_image,
+    "flat": flat_image,
+    "screenshot": screenshot_image,
+}
+
+def peak_rss_mb():
+    # ru_maxrss survives exec on Linux, VmHWM belongs to this process only
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if(line.startswith("VmHWM:")):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_case(image_path, params, reference, queue):
+    base_rss = peak_rss_mb()
+    start = time.perf_counter()
+    img = tint_engine.remap_palette(image_path, palette, seed=0, **params)
+    elapsed = time.perf_counter() - start
+    peak_rss = peak_rss_mb()
+
+    result = {"seconds": elapsed, "peak_rss_mb": peak_rss, "rss_growth_mb": peak_rss - base_rss}
+    if(reference):
+        # Same seed gives the same clusters, so this isolates the error of the fast assignment path
+        exact = dict(params, lut_bits=None)
+        expected = np.asarray(tint_engine.remap_palette(image_path, palette, seed=0, **exact), dtype=np.int16)
+        actual = np.asarray(img, dtype=np.int16)
+        result["mean_abs_error"] = float(np.abs(actual - expected).mean())
+        result["changed_pixels"] = float((actual != expected).any(axis=-1).mean())
+    queue.put(result)
+
+def check_lut_error(lut_bits, max_changed, max_mae, workers):
+    # Same clusters for both paths, so the difference is only the LUT's label assignment
+    width, height = size_for(1)
+    pixels = gradient_image(width, height, np.random.default_rng(0))
+    clusters = tint_engine.cluster_pixels(pixels, seed=0, lut_bits=lut_bits, workers=workers)
+    exact = dict(clusters, lut_bits=None, label_lut=None)
+
+    lut_labels = tint_engine.label_pixels(pixels, clusters, workers=workers)[0]
+    exact_labels = tint_engine.label_pixels(pixels, exact, workers=workers)[0]
+    actual = np.asarray(tint_engine.tint_pixels(pixels, clusters, palette, workers=workers), dtype=np.int16)
+    expected = np.asarray(tint_engine.tint_pixels(pixels, exact, palette, workers=workers), dtype=np.int16)
+
+    relabeled = float((lut_labels != exact_labels).mean())
+    changed = float((actual != expected).any(axis=-1).mean())
+    mae = float(np.abs(actual - expected).mean())
+    print(f"lut_bits {lut_bits}: {relabeled * 100:.2f}% relabeled, {changed * 100:.2f}% pixels changed (max {max_changed * 100:.2f}%), MAE {mae:.3f} (max {max_mae:.3f})")
+    return changed <= max_changed and mae <= max_mae
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the wallpaper tint engine")
+    parser.add_argument("--megapixels", default="1,4,8,16,40", help="comma separated image sizes")
+    parser.add_argument("--kinds", default=",".join(kinds), help="comma separated image kinds")
+    parser.add_argument("--settings", default="36:10000,16:5000,64:20000", help="comma separated n_colors:sample_size pairs")
+    parser.add_argument("--lut-bits", type=int, default=tint_engine.LUT_BITS, help="0 for the exact path")
+    parser.add_argument("--workers", type=int, default=tint_engine.WORKERS)
+    parser.add_argument("--no-reference", action="store_true", help="skip the exact reference and error columns")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--check", action="store_true", help="only check the LUT error bounds on a fixed image")
+    parser.add_argument("--max-changed", type=float, default=0.03, help="share of output pixels the LUT may change")
+    parser.add_argument("--max-mae", type=float, default=1.5, help="mean absolute error the LUT may add, in 8-bit levels")
+    args = parser.parse_args()
+
+    if(args.check):
+        sys.exit(0 if check_lut_error(args.lut_bits or tint_engine.LUT_BITS, args.max_changed, args.max_mae, args.workers) else 1)
+
+    settings = [tuple(int(v) for v in pair.split(":")) for pair in args.settings.split(",")]
+    rng = np.random.default_rng(0)
+    ctx = mp.get_context("spawn") # Fresh interpreter per case, so peak RSS is not inherited
+    results = []
+
+    print(f"{'image':<12}{'MP':>5}{'colors':>8}{'sample':>8}{'seconds':>10}{'peak MB':>10}{'growth MB':>11}{'MAE':>8}{'changed':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind in args.kinds.split(","):
+            for megapixels in (float(mp_) for mp_ in args.megapixels.split(",")):
+                width, height = size_for(megapixels)
+                image_path = os.path.join(tmp, f"{kind}-{megapixels}.jpg")
+                Image.fromarray(kinds[kind](width, height, rng)).save(image_path, quality=92)
+
+                for n_colors, sample_size in settings:
+                    params = {"n_colors": n_colors, "sample_size": sample_size, "lut_bits": args.lut_bits or None, "workers": args.workers}
+                    queue = ctx.Queue()
+                    process = ctx.Process(target=run_case, args=(image_path, params, not args.no_reference, queue))
+                    process.start()
+                    result = queue.get()
+                    process.join()
+
+                    result.update({"kind": kind, "megapixels": megapixels, "width": width, "height": height, **params})
+                    results.append(result)
+                    print(f"{kind:<12}{megapixels:>5g}{n_colors:>8}{sample_size:>8}{result['seconds']:>10.2f}{result['peak_rss_mb']:>10.0f}"
+                          f"{result['rss_growth_mb']:>11.0f}{result.get('mean_abs_error', float('nan')):>8.3f}{result.get('changed_pixels', float('nan')) * 100:>8.2f}%")
+                os.remove(image_path)
+
+    if(args.json):
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# artifacts.py
+#
+# Copyright 2026 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+
+import json, os, shutil, tempfile, threading, time
+from gi.repository import GLib
+from .output_files import content_hash, replace_file, write_if_changed, remove_output
+
+ARTIFACT_SETS = 48
+STALE_PART_SECONDS = 3600
+
+# Every rendered output set lives in its own versioned directory in the cache. Activating one copies its files
+# onto the real targets, each with an atomic replace, so sandboxed apps that can only see ~/.config keep working
+# and clearing the cache leaves nothing dangling. The main loop and the apply thread both activate, hence the lock
+artifact_dir = os.path.join(GLib.get_user_cache_dir(), "rewaita", "artifacts")
+sets_dir = os.path.join(artifact_dir, "sets")
+active_file = os.path.join(artifact_dir, "active") # Key of the active set, a symlink to it in older versions
+activation_lock = threading.Lock()
+
+artifact_targets = {
+    "gtk4": os.path.join(os.path.expanduser("~/.config"), "gtk-4.0", "gtk.css"),
+    "gtk3": os.path.join(os.path.expanduser("~/.config"), "gtk-3.0", "gtk.css"),
+    "gnome-shell": os.path.join(GLib.getenv("HOME"), ".local", "share", "themes", "rewaita", "gnome-shell", "gnome-shell.css"),
+}
+
+def artifact_key(payload):
+    return content_hash(json.dumps(payload, sort_keys=True).encode()).hex()
+
+def set_path(key):
+    return os.path.join(sets_dir, key)
+
+def read_manifest(path):
+    try:
+        with open(os.path.join(path, "manifest.json"), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def has_set(key):
+    return os.path.exists(os.path.join(set_path(key), "manifest.json"))
+
+def write_set(key, outputs, provider_css, accent, colors):
+    # Rendered into a private directory and renamed into place, so a set is either complete or absent
+    if(has_set(key)):
+        return False
+    os.makedirs(sets_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=f"{key}.", suffix=".part", dir=sets_dir)
+    manifest = {"outputs": {}, "accent": accent, "colors": colors} # colors are what the Firefox theme is built from
+    for name, text in outputs.items():
+        data = text.encode()
+        with open(os.path.join(tmp, f"{name}.css"), "wb") as f:
+            f.write(data)
+        manifest["outputs"][name] = content_hash(data).hex()
+    with open(os.path.join(tmp, "provider.css"), "w") as f:
+        f.write(provider_css)
+    with open(os.path.join(tmp, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+
+    try:
+        os.rename(tmp, set_path(key))
+    except OSError: # Another thread published the same set first
+        shutil.rmtree(tmp, ignore_errors=True)
+        return False
+    return True
+
+def active_set():
+    try:
+        if(os.path.islink(active_file)):
+            key = os.path.basename(os.readlink(active_file))
+        else:
+            with open(active_file, "r") as f:
+                key = f.read().strip()
+    except OSError:
+        return None
+    return set_path(key) if key else None
+
+def linked_into_cache(target):
+    return os.path.islink(target) and os.readlink(target).startswith(artifact_dir)
+
+def activate_set(key):
+    # Returns the names of the outputs whose bytes changed, None if the set is missing
+    path = set_path(key)
+    with activation_lock:
+        manifest = read_manifest(path)
+        if(manifest is None):
+            return None
+        outputs = manifest["outputs"]
+        current = active_set()
+        previous = (read_manifest(current) or {}).get("outputs", {}) if current else {}
+        changed = set()
+
+        for name, target in artifact_targets.items():
+            if(name in outputs):
+                with open(os.path.join(path, f"{name}.css"), "r") as f:
+                    if(write_if_changed(target, f.read())):
+                        changed.add(name)
+            elif(name in previous or linked_into_cache(target)):
+                if(remove_output(target)):
+                    changed.add(name)
+
+        if(current != path):
+            replace_file(active_file, key.encode())
+        os.utime(path) # Keeps recently used sets out of eviction
+    return changed
+
+def load_set(key):
+    # What the app's own CSS provider needs from a set
+    manifest = read_manifest(set_path(key))
+    if(manifest is None):
+        return None
+    with open(os.path.join(set_path(key), "provider.css"), "r") as f:
+        css = f.read()
+    accent = manifest["accent"]
+    return {"css": css, "accent": tuple(accent) if accent else None, "colors": manifest["colors"]}
+
+def evict_sets(max_sets=ARTIFACT_SETS):
+    # Least recently activated sets go first, the active one always stays
+    if(not os.path.isdir(sets_dir)):
+        return
+    with activation_lock:
+        current = active_set()
+        sets = []
+        for name in os.listdir(sets_dir):
+            path = os.path.join(sets_dir, name)
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            if(name.endswith(".part")):
+                if(time.time() - mtime > STALE_PART_SECONDS):
+                    shutil.rmtree(path, ignore_errors=True)
+            elif(path != current):
+                sets.append((mtime, path))
+        sets.sort()
+        for _mtime, path in sets[:max(0, len(sets) - max_sets + 1)]:
+            shutil.rmtree(path, ignore_errors=True)
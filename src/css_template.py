@@ -0,0 +1,56 @@
+# css_template.py
+#
+# Copyright 2026 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+
+import hashlib, re
+
+AT_RULES = {"define-color", "import", "media", "keyframes", "font-face", "supports"}
+
+class CssTemplate:
+    placeholder = re.compile(r"@([a-zA-Z][\w-]*)")
+    definition = re.compile(r"@define-color\s+([\w-]+)")
+
+    def __init__(self, text, names=(), label="template"):
+        # Split once into literal text and @name slots, the regex takes the whole name so
+        # @accent-color never matches the front of @accent-color-transparent.
+        # Every slot must be one of names or a color the template defines itself
+        names, defined = set(names), set(self.definition.findall(text))
+        self.digest = hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
+        self.parts = []
+        unknown = set()
+        start = 0
+        for match in self.placeholder.finditer(text):
+            slot = match.group(1)
+            if(slot in AT_RULES):
+                continue
+            if(slot not in names and slot not in defined):
+                unknown.add(slot)
+            self.parts += [text[start:match.start()], slot]
+            start = match.end()
+        self.parts.append(text[start:])
+
+        if(unknown):
+            raise ValueError(f"{label}: unknown placeholders {', '.join('@' + slot for slot in sorted(unknown))}")
+        self.slots = self.parts[1::2]
+
+    def render(self, values):
+        # Missing values are left as @name for GTK to resolve against the template's own colors
+        parts = self.parts.copy()
+        parts[1::2] = [values.get(slot, f"@{slot}") for slot in self.slots]
+        return "".join(parts)
@@ -17,101 +17,320 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from PIL import Image
-import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
-import gi, os, asyncio, random
+import gi, os, hashlib, time
 gi.require_version('XdpGtk4', '1.0')
 from gi.repository import Gtk, GLib, Gio, Xdp, XdpGtk4, Adw, Gdk
 from .loading_dialog import LoadingDialog
+from .theme_index import theme_index
+from .utils import Preferences
+from .tint_engine import load_pixels, cluster_pixels, label_pixels, tint_labels, stage_progress, save_clusters, load_clusters, LUT_BITS, WORKERS
 
 picture_path = os.path.join(GLib.get_user_data_dir(), "wallpapers")
-def hex_to_rgb(hex_color):
-    hex_color = hex_color.lstrip('#')
-    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
-
-def srgb_to_linear(c_uint8: np.ndarray) -> np.ndarray:
-    c = c_uint8 / 255.0
-    return np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
-
-def linear_to_oklab(rgb_lin: np.ndarray) -> np.ndarray:
-    r, g, b = rgb_lin[:, 0], rgb_lin[:, 1], rgb_lin[:, 2]
-    l = 0.4122214708*r + 0.5363325363*g + 0.0514459929*b
-    m = 0.2119034982*r + 0.6806995451*g + 0.1073969566*b
-    s = 0.0883024619*r + 0.2817188376*g + 0.6299787005*b
-    l_, m_, s_ = np.cbrt(l), np.cbrt(m), np.cbrt(s)
-    return np.stack([
-        0.2104542553*l_ + 0.7936177850*m_ - 0.0040720468*s_,
-        1.9779984951*l_ - 2.4285922050*m_ + 0.4505937099*s_,
-        0.0259040371*l_ + 0.7827717662*m_ - 0.8086757660*s_,
-    ], axis=1)
-
-def to_lab(arr_uint8: np.ndarray) -> np.ndarray:
-    return linear_to_oklab(srgb_to_linear(arr_uint8.astype(np.float32)))
-
-def kmeans_plus_plus(sample: np.ndarray, k: int) -> np.ndarray:
-    centroids = [sample[np.random.randint(len(sample))]]
-    for _ in range(1, k):
-        diff = sample[:, None, :] - np.array(centroids)[None, :, :]
-        dists = np.einsum('ijk,ijk->ij', diff, diff).min(axis=1)
-        total = dists.sum()
-        if(total > 0):
-            probs = dists / total
-        else:
-            probs = np.full(len(sample), 1.0 / len(sample))
-        centroids.append(sample[np.random.choice(len(sample), p=probs)])
-    return np.array(centroids, dtype=np.float32)
-
-def kmeans(sample: np.ndarray, k: int, max_iter: int) -> np.ndarray:
-    centroids = kmeans_plus_plus(sample, k)
-    for _ in range(max_iter):
-        diff = sample[:, None, :] - centroids[None, :, :]
-        labels = np.einsum('ijk,ijk->ij', diff, diff).argmin(axis=1)
-        new_centroids = np.array([
-            sample[labels == i].mean(axis=0) if np.any(labels == i) else centroids[i]
-            for i in range(k)
-        ], dtype=np.float32)
-        if(np.allclose(centroids, new_centroids, atol=1e-8)):
+cluster_cache_path = os.path.join(GLib.get_user_cache_dir(), "rewaita", "clusters")
+WALLPAPER_CACHE_SIZE = 256 * 1024 * 1024
+CLUSTER_CACHE_SIZE = 512 * 1024 * 1024
+CLUSTER_PARAMS = {"n_colors": 36, "sample_size": 10000}
+TINT_PARAMS = {**CLUSTER_PARAMS, "blend": 1.0}
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+PREVIEW_PARAMS = {"n_colors": 36, "max_iter": 30, "sample_size": 1000, "lut_bits": 4}
+
+def file_digest(file_path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def tint_cache_key(image_digest, palette_hex, params):
+    # Same image bytes, palette and parameters always produce the same tint
+    key = hashlib.blake2b(digest_size=8)
+    key.update(image_digest.encode())
+    key.update(",".join(c.lower() for c in palette_hex).encode())
+    key.update(repr(sorted(params.items())).encode())
+    return key.hexdigest()
+
+def tinted_output_path(file_path, key):
+    return os.path.join(picture_path, f"{os.path.basename(file_path)}-{key}-tinted.jpg")
+
+def save_tinted(img, output_path):
+    # Written aside and renamed so an interrupted save is never served from the cache
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    img.save(f"{output_path}.part", format="JPEG")
+    os.replace(f"{output_path}.part", output_path)
+
+def evict_lru(directory, suffixes, keep, max_size):
+    # Least recently used first, cache hits bump the mtime
+    entries = []
+    if(not os.path.isdir(directory)): # Nothing cached yet
+        return
+    for entry in os.scandir(directory):
+        if(entry.name.endswith(suffixes) and entry.is_file()):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _mtime, size, _path in entries)
+    for _mtime, size, path in sorted(entries):
+        if(total <= max_size):
             break
-        centroids = new_centroids
-    return centroids
-
-async def remap_palette(image_path, target_palette_hex, n_colors=36, blend=1.0, max_iter=100, sample_size=10000):
-    img = Image.open(image_path).convert("RGB")
-    arr = np.array(img, dtype=np.float32).reshape(-1, 3)
-
-    arr_lab = to_lab(arr)
-    pal_rgb = np.array([hex_to_rgb(h) for h in target_palette_hex], dtype=np.float32)
-    pal_lab = to_lab(pal_rgb)
-
-    idx = np.random.choice(len(arr_lab), size=min(sample_size, len(arr_lab)), replace=False)
-    sample = arr_lab[idx]
-    centroids_lab = kmeans(sample, n_colors, max_iter)
-
-    diff = arr_lab[:, None, :] - centroids_lab[None, :, :]
-    all_labels = np.einsum('ijk,ijk->ij', diff, diff).argmin(axis=1)
-
-    diff_p = centroids_lab[:, None, :] - pal_lab[None, :, :]
-    closest_pal_idx = np.einsum('ijk,ijk->ij', diff_p, diff_p).argmin(axis=1)
-    mapped_palette_rgb = pal_rgb[closest_pal_idx]
-
-    if(blend < 1.0):
-        centroids_rgb = np.array([
-            arr[all_labels == i].mean(axis=0) if np.any(all_labels == i) else np.zeros(3)
-            for i in range(n_colors)
-        ], dtype=np.float32)
-        blended = mapped_palette_rgb * blend + centroids_rgb * (1.0 - blend)
+        if(path in keep):
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError as e:
+            print(f"Could not remove {path}: {e}")
+
+def evict_tinted_wallpapers(keep=(), max_size=WALLPAPER_CACHE_SIZE):
+    evict_lru(picture_path, ("-tinted.jpg",), set(keep), max_size)
+
+def image_clusters(file_path, digest, workers=WORKERS, progress=None):
+    # Clustering only depends on the image, so later tints with any theme are a palette match and a gather
+    path = os.path.join(cluster_cache_path, tint_cache_key(digest, [], {**CLUSTER_PARAMS, "lut_bits": LUT_BITS}))
+    clusters = load_clusters(path)
+    if(clusters is not None):
+        for suffix in [".npy", ".npz"]:
+            os.utime(path + suffix)
+    else:
+        if(progress is not None):
+            progress("decode", 0.0)
+        pixels = load_pixels(file_path)
+        clusters = cluster_pixels(pixels, lut_bits=LUT_BITS, workers=workers, progress=progress, **CLUSTER_PARAMS)
+        clusters["labels"], clusters["centroids_rgb"] = label_pixels(pixels, clusters, workers=workers, progress=stage_progress(progress, "assign", 0.0, 0.8))
+        try:
+            os.makedirs(cluster_cache_path, exist_ok=True)
+            save_clusters(path, clusters)
+        except OSError as e:
+            print(f"Could not cache clusters for {file_path}: {e}")
+
+    evict_lru(cluster_cache_path, (".npy", ".npz"), {path + ".npy", path + ".npz"}, CLUSTER_CACHE_SIZE)
+    return clusters
+
+def theme_palette(theme_file):
+    palette = theme_index.record(theme_file)["palette"]
+    theme_index.save()
+    return palette
+
+def expand_image_paths(paths):
+    images = []
+    for path in paths:
+        path = os.path.expanduser(path)
+        if(os.path.isdir(path)):
+            images += sorted(os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            images.append(path)
+    return images
+
+def tint_batch(image_paths, themes, output_dir=None, workers=WORKERS):
+    # themes is a list of (name, theme file), every image is decoded and clustered once for all of them.
+    # Returns how many images failed
+    palettes = [(name, theme_palette(theme_file)) for name, theme_file in themes]
+    images = expand_image_paths(image_paths)
+    if(not images):
+        print("No images to tint")
+        return 1
+    if(output_dir):
+        output_dir = os.path.expanduser(output_dir)
+
+    jobs = min(len(images), workers)
+    tile_workers = max(1, workers // jobs)
+
+    def tint_image(image_path):
+        stem = os.path.splitext(os.path.basename(image_path))[0]
+        try:
+            digest = file_digest(image_path)
+        except OSError as e:
+            print(f"Could not read {image_path}: {e}")
+            return False
+
+        targets = []
+        for name, palette in palettes:
+            if(output_dir):
+                output_path = os.path.join(output_dir, f"{stem}-{name}.jpg")
+            else:
+                output_path = tinted_output_path(image_path, tint_cache_key(digest, palette, TINT_PARAMS))
+                if(os.path.exists(output_path)):
+                    os.utime(output_path)
+                    print(f"{image_path} x {name}: cached -> {output_path}")
+                    continue
+            targets.append((name, palette, output_path))
+        if(not targets):
+            return True
+
+        start = time.perf_counter()
+        try:
+            clusters = image_clusters(image_path, digest, tile_workers)
+        except OSError as e:
+            print(f"Could not open {image_path}: {e}")
+            return False
+        if("stats" in clusters):
+            print(f"{image_path}: decoded and clustered in {time.perf_counter() - start:.2f}s ({clusters['stats']['iterations']} iterations)")
+        else:
+            print(f"{image_path}: cached clusters loaded in {time.perf_counter() - start:.2f}s")
+
+        ok = True
+        for name, palette, output_path in targets:
+            start = time.perf_counter()
+            try:
+                save_tinted(tint_labels(clusters, palette, TINT_PARAMS["blend"], workers=tile_workers), output_path)
+            except Exception as e: # One bad output shouldn't stop the rest of the batch
+                print(f"Could not tint {image_path} x {name}: {e}")
+                ok = False
+                continue
+            print(f"{image_path} x {name}: {time.perf_counter() - start:.2f}s -> {output_path}")
+        return ok
+
+    def safe_tint_image(image_path):
+        try:
+            return tint_image(image_path)
+        except Exception as e:
+            print(f"Could not tint {image_path}: {e}")
+            return False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        failed = list(pool.map(safe_tint_image, images)).count(False)
+    print(f"Tinted {len(images) - failed} of {len(images)} image(s) with {len(palettes)} theme(s) in {time.perf_counter() - start:.2f}s")
+
+    if(not output_dir):
+        evict_tinted_wallpapers()
+    return failed
+
+MAX_TINT_JOBS = 1
+
+class TintJobManager:
+    # Runs tint jobs off the main loop, a newer request cancels everything before it
+    def __init__(self, max_jobs=MAX_TINT_JOBS):
+        self.max_jobs = max_jobs
+        self.running = []
+        self.pending = None
+
+    def submit(self, work, on_progress, on_done):
+        # work(progress) runs in a thread, on_progress(stage, fraction) and on_done(result, error)
+        # run on the main loop, a superseded job finishes with on_done(None, None)
+        self.cancel_all()
+        self.pending = (work, on_progress, on_done)
+        self.start_pending()
+
+    def cancel_all(self):
+        for cancellable in self.running:
+            cancellable.cancel()
+        if(self.pending is not None):
+            self.pending[2](None, None)
+            self.pending = None
+
+    def start_pending(self):
+        if(self.pending is None or len(self.running) >= self.max_jobs):
+            return
+        work, on_progress, on_done = self.pending
+        self.pending = None
+        cancellable = Gio.Cancellable()
+        self.running.append(cancellable)
+        results = {}
+
+        def progress(stage, fraction):
+            cancellable.set_error_if_cancelled()
+            GLib.idle_add(on_progress, stage, fraction)
+
+        def task_func(task, source_object, task_data, task_cancellable):
+            try:
+                results["value"] = work(progress)
+            except GLib.Error as e:
+                if(not e.matches(Gio.io_error_quark(), Gio.IOErrorEnum.CANCELLED)):
+                    results["error"] = e
+            except Exception as e:
+                results["error"] = e
+            task.return_boolean(True)
+
+        def on_task_done(task, result, user_data=None):
+            self.running.remove(cancellable)
+            on_done(results.get("value"), results.get("error"))
+            self.start_pending()
+
+        task = Gio.Task.new(None, None, on_task_done)
+        task.run_in_thread(task_func)
+
+tint_jobs = TintJobManager()
+auto_tint_jobs = TintJobManager() # Separate so background re-tints never cancel an interactive one
+
+def tint_to_cache(file_path, palette_vals, progress, keep=()):
+    digest = file_digest(file_path)
+    output_path = tinted_output_path(file_path, tint_cache_key(digest, palette_vals, TINT_PARAMS))
+    if(os.path.exists(output_path)):
+        os.utime(output_path)
     else:
-        blended = mapped_palette_rgb
+        clusters = image_clusters(file_path, digest, progress=progress)
+        img = tint_labels(clusters, palette_vals, TINT_PARAMS["blend"], progress=stage_progress(progress, "assign", 0.8))
+        progress("encode", 0.0)
+        save_tinted(img, output_path)
+    evict_tinted_wallpapers([output_path, *keep])
+    return output_path
+
+def set_wallpaper(parent, output_path, flags=Xdp.WallpaperFlags.PREVIEW):
+    portal = Xdp.Portal()
+    top = XdpGtk4.parent_new_gtk(parent) if parent is not None else None # The background service has no window
+    portal.set_wallpaper(
+        top,
+        f"file://{output_path}",
+        flags
+        | Xdp.WallpaperFlags.BACKGROUND
+        | Xdp.WallpaperFlags.LOCKSCREEN,
+    )
+
+auto_tint_paths = {} # (source, theme file) -> tinted wallpaper
+auto_tint_state = {"wallpaper": None, "wanted": None} # wanted is the latest (source, theme file), jobs finish after flips
 
-    blended = np.clip(blended, 0, 255).astype(np.uint8)
+def auto_tint_variants(prefs):
+    variants = {}
+    for theme_type in ["light", "dark"]:
+        theme = prefs[f"{theme_type}-theme"]
+        if(theme != "default"):
+            variants[theme_type] = os.path.join(GLib.get_user_data_dir(), theme_type, theme)
+    return variants
 
-    recolored = blended[all_labels].reshape(img.size[1], img.size[0], 3)
-    return Image.fromarray(recolored)
+def update_auto_tint(parent, prefs, scheme):
+    source = prefs["tint-source"]
+    if(not prefs["auto-tint"] or not source or not os.path.exists(source)):
+        return
+
+    variants = auto_tint_variants(prefs)
+    current = variants.get("dark" if scheme == 1 else "light")
+    auto_tint_state["wanted"] = (source, current)
+
+    def apply_current():
+        output_path = auto_tint_paths.get(auto_tint_state["wanted"])
+        if(output_path is None or output_path == auto_tint_state["wallpaper"] or not os.path.exists(output_path)):
+            return
+        auto_tint_state["wallpaper"] = output_path
+        set_wallpaper(parent, output_path, Xdp.WallpaperFlags.NONE)
+
+    missing = [theme_file for theme_file in variants.values() if not os.path.exists(auto_tint_paths.get((source, theme_file), ""))]
+    apply_current()
+    if(not missing):
+        return
+
+    missing.sort(key=lambda theme_file: theme_file != current) # The visible variant goes first
+
+    def work(progress):
+        paths = {}
+        for theme_file in missing:
+            # Both variants stay cached, the clusters are shared so the second one is only a label remap
+            paths[theme_file] = tint_to_cache(source, theme_palette(theme_file), progress, keep=paths.values())
+        return paths
 
-def make_new_image(parent, file_path):
-    from .theme_page import load_colors_from_css
-    output_path = os.path.join(picture_path, f"{os.path.basename(file_path)}-tinted.jpg")
+    def on_done(paths, error):
+        if(error is not None):
+            print(f"Could not re-tint {source}: {error}")
+        if(paths is None):
+            return
+        for theme_file, output_path in paths.items():
+            auto_tint_paths[(source, theme_file)] = output_path
+        apply_current()
+
+    auto_tint_jobs.submit(work, lambda stage, fraction: None, on_done)
+
+def make_new_image(parent, file_path, theme_file=None):
 
     theme_type = {
         0: "light",
@@ -124,9 +343,7 @@ def make_new_image(parent, file_path):
     else:
         theme = parent.dark_theme
 
-    portal = Xdp.Portal()
-
-    if(theme == "default"):
+    if(theme_file is None and theme == "default"):
         dialog = Adw.AlertDialog.new()
         dialog.set_body(_("Please select a theme first"))
 
@@ -138,36 +355,32 @@ def make_new_image(parent, file_path):
         dialog.present(parent)
         return
 
-    palette_vals = list(load_colors_from_css(os.path.join(parent.data_dir, theme_type[parent.pref], theme)).values())
-    palette_vals = [c for c in palette_vals if not c.startswith('@')]
-
-    spinner = LoadingDialog(parent)
+    active_file = os.path.join(parent.data_dir, theme_type[parent.pref], theme) if theme != "default" else None
+    if(theme_file is None):
+        theme_file = active_file
+    palette_vals = theme_palette(theme_file)
 
-    def task_func(task, source_object, task_data, cancellable):
-        spinner.present(parent)
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        img = loop.run_until_complete(remap_palette(file_path, palette_vals))
-        loop.close()
+    spinner = LoadingDialog(parent, tint_jobs.cancel_all)
 
-        img.save(f"{output_path}")
-        task.return_value(output_path)
+    def work(progress):
+        return tint_to_cache(file_path, palette_vals, progress)
 
-    def on_done(task, result, user_data=None):
+    def on_done(output_path, error):
         spinner.set_can_close(True), spinner.close()
-        top = XdpGtk4.parent_new_gtk(parent)
-        portal.set_wallpaper(
-            top,
-            f"file://{output_path}",
-            Xdp.WallpaperFlags.PREVIEW
-            | Xdp.WallpaperFlags.BACKGROUND
-            | Xdp.WallpaperFlags.LOCKSCREEN,
-        )
-
-    task = Gio.Task.new(None, None, on_done)
-    task.run_in_thread(task_func)
-
-def on_image_opened(file_dialog, result, parent):
-    file = file_dialog.open_finish(result)
-    file_path = file.get_path()
-    make_new_image(parent, file_path)
+        if(error is not None):
+            print(f"Could not tint {file_path}: {error}")
+        if(output_path is None):
+            return
+        set_wallpaper(parent, output_path)
+        parent.tint_source = file_path
+        parent.save_prefs()
+        auto_tint_paths[(file_path, theme_file)] = output_path
+        auto_tint_state["wallpaper"] = output_path
+        if(theme_file == active_file):
+            update_auto_tint(parent, Preferences().get_all(), parent.pref)
+        else: # Picked with another theme in the dialog, so keep it until the theme or scheme changes
+            auto_tint_jobs.cancel_all()
+            auto_tint_state["wanted"] = (file_path, theme_file)
+
+    tint_jobs.submit(work, spinner.set_progress, on_done)
+    spinner.present(parent)
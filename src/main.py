@@ -17,7 +17,7 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-import sys, gi, os, re
+import sys, gi, os
 
 gi.require_version('Gtk', '4.0')
 gi.require_version('Adw', '1')
@@ -25,7 +25,9 @@ gi.require_version('Xdp', '1.0')
 
 from gi.repository import Gtk, Gdk, Gio, Adw, GLib, Xdp, GObject
 from .utils import Preferences, change_autostart
-from .window import RewaitaWindow
+from .image_modifier import tint_batch
+from .theme_service import ThemeService
+from .theme_index import theme_index, theme_slug
 
 class RewaitaApplication(Adw.Application):
     def __init__(self):
@@ -63,10 +65,41 @@ class RewaitaApplication(Adw.Application):
             None,
         )
 
-        self.grab_prefs()
+        self.add_main_option(
+            "tint",
+            0,
+            GLib.OptionFlags.NONE,
+            GLib.OptionArg.STRING_ARRAY,
+            "Tints the given images or folders of images, can be repeated",
+            "PATH",
+        )
+
+        self.add_main_option(
+            "tint-theme",
+            0,
+            GLib.OptionFlags.NONE,
+            GLib.OptionArg.STRING_ARRAY,
+            "Theme to tint with (as shown by --list), can be repeated",
+            "THEME",
+        )
 
-    def grab_prefs(self):
-        win = RewaitaWindow
+        self.add_main_option(
+            "tint-output",
+            0,
+            GLib.OptionFlags.NONE,
+            GLib.OptionArg.STRING,
+            "Folder to write --tint results to instead of the wallpapers folder",
+            "DIR",
+        )
+
+        self.theme_service = None
+        self.in_background = False
+
+    def do_startup(self):
+        Adw.Application.do_startup(self)
+        self.theme_service = ThemeService() # Only the primary instance applies themes
+
+    def grab_prefs(self, win):
         prefs = Preferences()
         all_prefs = prefs.get_all()
 
@@ -88,38 +121,53 @@ class RewaitaApplication(Adw.Application):
             win.trans_panel = all_prefs["trans-panel"]
             win.no_pills = all_prefs["no-pills"]
             win.accent = all_prefs["accent"]
+            win.auto_tint = all_prefs["auto-tint"]
+            win.tint_source = all_prefs["tint-source"]
         except:
             prefs.make_file()
-            self.grab_prefs()
+            self.grab_prefs(win)
+
+    def build_window(self):
+        # Imported here so the background service never loads the widgets
+        from .window import RewaitaWindow
+        self.grab_prefs(RewaitaWindow)
+        win = RewaitaWindow(application=self)
+        win.connect("close-request", self.on_close_request)
+        return win
+
+    def start_background(self):
+        # Holds the application with no window open, only the theme service stays resident
+        if(self.in_background):
+            return
+        self.in_background = True
+        self.hold()
+        self.portal = Xdp.Portal()
+        self.portal.request_background(
+            None,
+            "Automatic transitions between light/dark mode",
+            None,
+            Xdp.BackgroundFlags.ACTIVATABLE,
+            None,
+            self.on_background_response
+        )
 
     def on_close_request(self, window, *args):
+        # The window is destroyed rather than hidden, opening Rewaita again builds a new one
+        self.theme_service.window = None
         if(window.run_in_background):
-            window.hide()
-            return True
+            self.start_background()
+        elif(self.in_background):
+            self.in_background = False
+            self.release()
 
     def do_activate(self):
         win = self.props.active_window
         if not win:
-            win = RewaitaWindow(application=self)
+            win = self.build_window()
 
-        win.connect("close-request", self.on_close_request)
         if(win.run_in_background):
-            win.portal.request_background(
-                None,
-                "Automatic transitions between light/dark mode",
-                None,
-                Xdp.BackgroundFlags.ACTIVATABLE,
-                None,
-                self.on_background_response
-            )
-
+            self.start_background()
         win.present()
-        self.settings = Xdp.Portal().get_settings()
-        self.settings.connect("changed", self.on_settings_changed, win)
-
-    def on_settings_changed(self, settings, namespace, key, value, win):
-        if(namespace == "org.freedesktop.appearance" and key == "color-scheme" or namespace == "org.gnome.desktop.interface" and key == "accent-color"):
-            win.on_theme_selected()
 
     def on_guide_clicked(self, action, _):
         builder = Gtk.Builder().new_from_resource('/io/github/swordpuffin/rewaita/widgets/guide_dialog.ui')
@@ -149,45 +197,82 @@ class RewaitaApplication(Adw.Application):
             print("Background permission denied")
         change_autostart(success)
 
+    def do_handle_local_options(self, options):
+        # --tint runs in the calling process before it registers, so a resident background instance
+        # is never blocked by a batch and the output stays in the calling terminal
+        if(options.contains("tint")):
+            return self.tint_images(options.end().unpack())
+        return -1
+
     def do_command_line(self, args):
         options = args.get_options_dict().end().unpack()
-        win = self.props.active_window
-        if not win:
-            win = RewaitaWindow(application=self)
-
-        self.activate()
-
-        if("background" in options):
-            win.emit("close-request")
-
-        theme_type = "light" if win.pref in [0, 2] else "dark"
+        theme_type = "light" if self.theme_service.color_scheme() in [0, 2] else "dark"
 
         if("theme" in options):
-            for arg in sys.argv: # For whatever reason, options doesn't include the value of --theme=, just that it is a flag
+            for arg in args.get_arguments(): # For whatever reason, options doesn't include the value of --theme=, just that it is a flag
                 if(arg.startswith("--theme=")):
-                    theme = arg.split("=")[1]
-                    self.set_theme(win, theme, theme_type)
-                    sys.exit(0)
+                    return self.set_theme(arg.split("=")[1], theme_type)
 
         if("list" in options):
-            print(list(map(self.adjust_theme_name, os.listdir(os.path.join(win.data_dir, theme_type)))))
-            sys.exit(0)
+            themes = theme_index.scan(os.path.join(GLib.get_user_data_dir(), theme_type))
+            theme_index.save()
+            print([record["slug"] for theme, record in themes])
+            return 0
 
-    def adjust_theme_name(self, theme_name):
-        emoji_pattern = re.compile(r"[\s\u200d\ufe0f]*[\U00010000-\U0010FFFF\u2600-\u2B55]+[\s\u200d\ufe0f]*", flags=re.UNICODE)
-        new_theme_name = emoji_pattern.sub('', theme_name).replace(" ", "-").replace(".css", "").lower()
-        return new_theme_name
+        if("background" in options): # Headless, the window is only built once Rewaita is actually opened
+            if(not self.props.active_window):
+                self.start_background()
+            return 0
 
-    def set_theme(self, win, theme_name, theme_type):
-        theme_files = os.listdir(os.path.join(win.data_dir, theme_type))
+        self.activate()
+        return 0
+
+    def find_theme_file(self, theme_name):
+        theme_dirs = [GLib.get_user_data_dir(), os.path.dirname(os.path.abspath(__file__))]
+        for theme_type in ["light", "dark"]:
+            for theme_dir in theme_dirs:
+                path = os.path.join(theme_dir, theme_type)
+                if(not os.path.isdir(path)):
+                    continue
+                for theme in os.listdir(path):
+                    if(theme_slug(theme) == theme_name):
+                        return os.path.join(path, theme)
+        return None
+
+    def tint_images(self, options):
+        themes = []
+        for theme_name in options.get("tint-theme", []):
+            theme_file = self.find_theme_file(theme_name)
+            if(theme_file is None):
+                print(f"Theme: {theme_name}, was not found\nUse --list to get all available themes")
+                return 1
+            themes.append((theme_name, theme_file))
+
+        if(not themes):
+            print("Use --tint-theme to choose at least one theme to tint with")
+            return 1
+
+        return 1 if tint_batch(options["tint"], themes, options.get("tint-output")) else 0
+
+    def set_theme(self, theme_name, theme_type):
+        theme_files = os.listdir(os.path.join(GLib.get_user_data_dir(), theme_type))
         comparison_name = theme_name
 
         for theme in theme_files:
-            adjusted_name = self.adjust_theme_name(theme)
+            adjusted_name = theme_slug(theme)
             if(adjusted_name == comparison_name):
-                win.on_theme_button_clicked(None, theme, theme_type)
-                return
+                win = self.props.active_window
+                if(win):
+                    win.on_theme_button_clicked(None, theme, theme_type)
+                else:
+                    Preferences().set(f"{theme_type}-theme", theme)
+                    if(self.in_background):
+                        self.theme_service.request() # Resident, so it goes through the scheduler like any other change
+                    else:
+                        self.theme_service.apply_now()
+                return 0
         print(f"Theme: {theme_name}, was not found\nUse --list to get all available themes")
+        return 1
 
     def on_about_action(self, *args):
         about = Adw.AboutDialog(application_name='Rewaita',
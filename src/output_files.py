@@ -0,0 +1,86 @@
+# output_files.py
+#
+# Copyright 2026 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+
+import hashlib, os, tempfile
+
+# Digest, size and mtime of what each generated file last held, so an apply that renders the same
+# bytes leaves it alone. A file deleted or edited behind our back no longer matches its stat and is rehashed
+output_hashes = {}
+output_stats = {"written": 0, "unchanged": 0, "shell_reloads": 0}
+
+def content_hash(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+def current_hash(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    cached = output_hashes.get(path)
+    if(cached is not None and cached[1:] == (stat.st_size, stat.st_mtime_ns)):
+        return cached[0]
+    with open(path, "rb") as f:
+        digest = content_hash(f.read())
+    output_hashes[path] = (digest, stat.st_size, stat.st_mtime_ns)
+    return digest
+
+def replace_file(path, data):
+    # A private temp file next to the target and one rename, readers never see a partial file
+    # and concurrent writers never share a temp name
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".part", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+def write_if_changed(path, text):
+    data = text.encode()
+    digest = content_hash(data)
+    # A symlink is always replaced, older versions linked the outputs into the cache
+    if(not os.path.islink(path) and current_hash(path) == digest):
+        output_stats["unchanged"] += 1
+        return False
+
+    replace_file(path, data)
+    stat = os.stat(path)
+    output_hashes[path] = (digest, stat.st_size, stat.st_mtime_ns)
+    output_stats["written"] += 1
+    return True
+
+def remove_output(path):
+    output_hashes.pop(path, None)
+    if(not os.path.exists(path)):
+        return False
+    os.remove(path)
+    output_stats["written"] += 1
+    return True
+
+def take_output_stats():
+    stats = dict(output_stats)
+    output_stats.update(written=0, unchanged=0, shell_reloads=0)
+    return stats
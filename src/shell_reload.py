@@ -0,0 +1,110 @@
+# shell_reload.py
+#
+# Copyright 2026 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from gi.repository import Gio, GLib
+from .output_files import output_stats
+
+SHELL_CALL_TIMEOUT_MS = 5000
+user_theme_extension = "user-theme@gnome-shell-extensions.gcampax.github.com"
+
+# The proxy is created on the first reload, and a reload asked for while one is in flight is folded into one more
+shell_reload = {"proxy": None, "running": False, "pending": False}
+
+def reset_shell():
+    # Callable from the apply thread, the proxy and its calls only live on the main loop
+    if(not "GNOME" in (GLib.getenv("XDG_CURRENT_DESKTOP") or "")):
+        return
+    output_stats["shell_reloads"] += 1
+    GLib.idle_add(start_shell_reload)
+
+def start_shell_reload():
+    if(shell_reload["running"]):
+        shell_reload["pending"] = True
+        return GLib.SOURCE_REMOVE
+    shell_reload["running"] = True
+
+    if(shell_reload["proxy"] is not None):
+        disable_user_theme(shell_reload["proxy"])
+        return GLib.SOURCE_REMOVE
+
+    def on_proxy(source, result):
+        try:
+            shell_reload["proxy"] = Gio.DBusProxy.new_for_bus_finish(result)
+        except GLib.Error as e:
+            print(f"Could not reach GNOME Shell: {e.message}")
+            finish_shell_reload()
+            return
+        disable_user_theme(shell_reload["proxy"])
+
+    Gio.DBusProxy.new_for_bus(
+        Gio.BusType.SESSION,
+        Gio.DBusProxyFlags.DO_NOT_LOAD_PROPERTIES | Gio.DBusProxyFlags.DO_NOT_CONNECT_SIGNALS,
+        None,
+        'org.gnome.Shell.Extensions',
+        '/org/gnome/Shell/Extensions',
+        'org.gnome.Shell.Extensions',
+        None,
+        on_proxy
+    )
+    return GLib.SOURCE_REMOVE
+
+def call_user_theme(proxy, method, on_done):
+    def on_reply(proxy, result):
+        try:
+            proxy.call_finish(result)
+        except GLib.Error as e:
+            print(f"{method} failed: {e.message}")
+        on_done()
+
+    proxy.call(method, GLib.Variant("(s)", (user_theme_extension,)),
+        Gio.DBusCallFlags.NONE, SHELL_CALL_TIMEOUT_MS, None, on_reply)
+
+def disable_user_theme(proxy):
+    # Enable runs even if disable failed or timed out, so the theme is never left switched off
+    call_user_theme(proxy, "DisableExtension", lambda: call_user_theme(proxy, "EnableExtension", finish_shell_reload))
+
+def finish_shell_reload():
+    shell_reload["running"] = False
+    if(shell_reload["pending"]):
+        shell_reload["pending"] = False
+        start_shell_reload()
+
+def reset_shell_sync():
+    # For one-shot command line applies, the process exits before an async reload would get to run
+    if(not "GNOME" in (GLib.getenv("XDG_CURRENT_DESKTOP") or "")):
+        return
+    output_stats["shell_reloads"] += 1
+    try:
+        proxy = Gio.DBusProxy.new_for_bus_sync(
+            Gio.BusType.SESSION,
+            Gio.DBusProxyFlags.DO_NOT_LOAD_PROPERTIES | Gio.DBusProxyFlags.DO_NOT_CONNECT_SIGNALS,
+            None,
+            'org.gnome.Shell.Extensions',
+            '/org/gnome/Shell/Extensions',
+            'org.gnome.Shell.Extensions',
+            None
+        )
+    except GLib.Error as e:
+        print(f"Could not reach GNOME Shell: {e.message}")
+        return
+    for method in ["DisableExtension", "EnableExtension"]:
+        try:
+            proxy.call_sync(method, GLib.Variant("(s)", (user_theme_extension,)), Gio.DBusCallFlags.NONE, SHELL_CALL_TIMEOUT_MS, None)
+        except GLib.Error as e:
+            print(f"{method} failed: {e.message}")
@@ -0,0 +1,205 @@
+# theme_apply.py
+#
+# Copyright 2026 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+
+import os, sys
+from gi.repository import Gio, GLib
+from .utils import parse_gtk_theme, get_accent_color, gtk3_window_controls, gtk4_window_controls, apply_firefox_theme, template_colors
+from .css_template import CssTemplate
+from .extra_options_box import extra_css
+from .output_files import content_hash
+from .theme_model import ThemeModel
+from .artifacts import artifact_key, has_set, write_set, activate_set, load_set, evict_sets
+from . import utils, css_template, theme_model, extra_options_box
+
+APPLY_DELAY_MS = 150
+
+class ApplyScheduler:
+    # A burst of requests becomes one apply of the latest state after a short delay.
+    # snapshot() and finish() run on the main loop, work() on a thread, and only one apply is in flight
+    def __init__(self, snapshot, work, finish, delay=APPLY_DELAY_MS):
+        self.snapshot = snapshot
+        self.work = work
+        self.finish = finish
+        self.delay = delay
+        self.timeout = 0
+        self.running = False
+        self.pending = False
+
+    def request(self, immediate=False):
+        # immediate skips the delay but not the queue, so it never overlaps an apply already running
+        if(self.timeout):
+            GLib.source_remove(self.timeout)
+            self.timeout = 0
+        if(immediate):
+            self.start()
+        else:
+            self.timeout = GLib.timeout_add(self.delay, self.start)
+
+    def start(self):
+        self.timeout = 0
+        if(self.running):
+            self.pending = True # Picked up as soon as the running apply finishes
+            return GLib.SOURCE_REMOVE
+
+        try: # Taken before marking it running, a failed snapshot must not block every later apply
+            state = self.snapshot()
+        except Exception as e:
+            print(f"Could not read the theme state: {e}")
+            return GLib.SOURCE_REMOVE
+        self.running = True
+        results = {}
+
+        def task_func(task, source_object, task_data, cancellable):
+            try:
+                results["value"] = self.work(state)
+            except Exception as e:
+                results["error"] = e
+            task.return_boolean(True)
+
+        def on_done(task, result, user_data=None):
+            self.running = False
+            if("error" in results):
+                print(f"Could not apply theme: {results['error']}")
+            else:
+                self.finish(state, results["value"])
+            if(self.pending):
+                self.pending = False
+                self.start()
+
+        task = Gio.Task.new(None, None, on_done)
+        task.run_in_thread(task_func)
+        return GLib.SOURCE_REMOVE
+
+ARTIFACT_VERSION = 2
+key_prefs = ["window", "transparency", "light-text", "accent-tabs", "dark-panel", "trans-panel",
+             "sharp", "no-pills", "modify-gtk3-theme", "modify-gnome-shell", "window-controls"]
+
+# Compiled once, every apply only fills in the colors
+shell_template = CssTemplate(open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "gnome-shell-template.css")).read(), template_colors, "gnome-shell-template.css")
+gtk3_template = CssTemplate(open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "gtk3-template", "gtk.css")).read(), template_colors, "gtk3-template/gtk.css")
+
+def source_digest(modules):
+    digest = b""
+    for module in modules:
+        with open(module.__file__, "rb") as f:
+            digest += content_hash(f.read())
+    return content_hash(digest).hex()
+
+# The code that renders the outputs, constants like accent_tab_css_gs and no_pill_css included.
+# Sets cached by an older install never match after an upgrade changes any of it
+render_source_digest = source_digest([utils, css_template, theme_model, extra_options_box, sys.modules[__name__]])
+
+def build_theme_state(prefs, theme_type, accent, reset_func):
+    # Everything an apply reads, taken from the saved preferences so it needs no window
+    return {
+        "theme_name": prefs["dark-theme"] if theme_type == "dark" else prefs["light-theme"],
+        "theme_type": theme_type,
+        "data_dir": GLib.get_user_data_dir(),
+        "extras": gtk4_window_controls(prefs["window-controls"]) + extra_css(prefs),
+        "window_control": prefs["window-controls"],
+        "modify_gtk3_theme": prefs["modify-gtk3-theme"],
+        "accent": accent,
+        "accent_fg": prefs["accent-fg"],
+        "prefs": prefs,
+        "gnome": "GNOME" in (GLib.getenv("XDG_CURRENT_DESKTOP") or ""),
+        "shell_template": shell_template,
+        "gtk3_template": gtk3_template,
+        "reset_func": reset_func,
+    }
+
+def theme_file(state):
+    return os.path.join(state["data_dir"], state["theme_type"], state["theme_name"])
+
+def default_theme_file(theme_type):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), f"default-{theme_type}.css")
+
+def state_key(state):
+    # Everything an output set depends on, the theme's own CSS included so an edited theme renders again
+    if(state["theme_name"] == "default"):
+        with open(default_theme_file(state["theme_type"]), "rb") as f:
+            theme_digest = content_hash(f.read()).hex()
+    else:
+        theme_digest = content_hash(ThemeModel.load(theme_file(state)).css.encode()).hex()
+    return artifact_key({
+        "version": ARTIFACT_VERSION,
+        "sources": render_source_digest,
+        "theme": [state["theme_type"], state["theme_name"], theme_digest],
+        "templates": [state["shell_template"].digest, state["gtk3_template"].digest],
+        "extras": state["extras"],
+        "window_control": [state["window_control"], content_hash(gtk3_window_controls(state["window_control"]).encode()).hex()],
+        "accent": [state["accent"], state["accent_fg"]],
+        "gnome": state["gnome"],
+        "prefs": {key: state["prefs"][key] for key in key_prefs},
+    })
+
+def theme_outputs(state):
+    # Renders every output in memory: (outputs, provider css, accent colors, derived colors)
+    if(state["theme_name"] == "default"):
+        gtk_css = open(default_theme_file(state["theme_type"])).read()
+        outputs = {"gtk4": state["extras"]}
+        if(state["modify_gtk3_theme"]):
+            outputs["gtk3"] = gtk_css + gtk3_window_controls(state["window_control"])
+        return outputs, gtk_css + state["extras"], None, None
+
+    model = ThemeModel.load(theme_file(state))
+    gtk_css = model.css
+    colors = dict(model.colors) # parse_gtk_theme adds its derived colors to this copy
+    accent_color, accent_fg = get_accent_color(colors, state["accent"], state["accent_fg"])
+    colors["accent-color"] = accent_color
+    colors["accent-fg-color"] = accent_fg
+    extras = "\n" + state["extras"] + f"\n@define-color accent_bg_color {accent_color};\n@define-color accent_fg_color {accent_fg};"
+
+    outputs = {"gtk4": gtk_css + extras}
+    outputs.update(parse_gtk_theme(colors, state["shell_template"], state["gtk3_template"], state["prefs"]))
+    return outputs, gtk_css + extras, (accent_color, accent_fg), colors
+
+def render_theme(state):
+    # Everything but the CSS provider, returns what the main loop still has to load.
+    # A prerendered set is only copied out, which is what makes scheme and accent flips fast
+    try: # I'd rather it just not do anything than fail, it's this stupid symlink system I have going on
+        key = state_key(state)
+        if(not has_set(key)):
+            outputs, css, accent, colors = theme_outputs(state)
+            write_set(key, outputs, css, accent, colors)
+    except FileNotFoundError:
+        print(f"Could not find: {theme_file(state)}")
+        return None
+
+    changed = activate_set(key)
+    if(changed is None): # Evicted between writing and activating
+        return None
+    result = load_set(key)
+    apply_firefox_theme(result["colors"], state["prefs"])
+    # Reloading restyles the whole shell, so only do it when its stylesheet really changed
+    if("gnome-shell" in changed):
+        state["reset_func"]()
+    return result
+
+def prerender_themes(states):
+    # Idle-time rendering of the sets a flip may need next, sets that already exist are skipped
+    for state in states:
+        try:
+            key = state_key(state)
+            if(not has_set(key)):
+                outputs, css, accent, colors = theme_outputs(state)
+                write_set(key, outputs, css, accent, colors)
+        except (FileNotFoundError, KeyError) as e:
+            print(f"Could not prerender {state['theme_type']}/{state['theme_name']}: {e}")
+    evict_sets()
@@ -0,0 +1,119 @@
+# theme_index.py
+#
+# Copyright 2026 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os, re, json, threading
+from gi.repository import GLib
+from .theme_model import ThemeModel
+
+INDEX_VERSION = 1
+swatch_keys = ["red-1", "orange-1", "yellow-1", "green-1", "blue-1", "dark-1", "light-1"]
+emoji_pattern = re.compile(r"[\s\u200d\ufe0f]*[\U00010000-\U0010FFFF\u2600-\u2B55]+[\s\u200d\ufe0f]*", flags=re.UNICODE)
+
+def theme_slug(theme_name):
+    # The name --list prints and --theme and --tint-theme accept
+    return emoji_pattern.sub('', theme_name).replace(" ", "-").replace(".css", "").lower()
+
+def theme_record(theme_file, stat):
+    with open(theme_file, "r") as f:
+        model = ThemeModel(theme_file, f.read()) # Not ThemeModel.load, a large library shouldn't stay in its cache
+    name = os.path.basename(theme_file)
+    return {
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "name": name.replace(".css", ""),
+        "slug": theme_slug(name),
+        "palette": model.palette(),
+        "background": model.colors.get("window-bg-color"),
+        "foreground": model.colors.get("window-fg-color"),
+        "swatches": [model.colors[key] for key in swatch_keys if model.colors.get(key)],
+    }
+
+class ThemeIndex:
+    # Parsed theme metadata kept on disk, a record is only rebuilt when its file's mtime or size changes.
+    # Records are looked up from the main loop and from tint threads, so every access holds the lock
+    def __init__(self, path):
+        self.path = path
+        self.records = None
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def ensure_loaded(self):
+        if(self.records is not None):
+            return
+        self.records = {}
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            if(data.get("version") == INDEX_VERSION):
+                self.records = data["themes"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def record(self, theme_file):
+        stat = os.stat(theme_file)
+        with self.lock:
+            self.ensure_loaded()
+            record = self.records.get(theme_file)
+        if(record is not None and record["mtime_ns"] == stat.st_mtime_ns and record["size"] == stat.st_size):
+            return record
+
+        record = theme_record(theme_file, stat)
+        with self.lock:
+            self.records[theme_file] = record
+            self.dirty = True
+        return record
+
+    def scan(self, theme_dir):
+        # (file name, record) for every readable theme in theme_dir, records of files that are gone are dropped
+        themes = []
+        for theme in os.listdir(theme_dir):
+            try:
+                themes.append((theme, self.record(os.path.join(theme_dir, theme))))
+            except (OSError, ValueError): # Dangling symlinks, files removed mid scan and files that aren't text
+                continue
+
+        present = {os.path.join(theme_dir, theme) for theme, record in themes}
+        with self.lock:
+            stale = [path for path in self.records if os.path.dirname(path) == theme_dir and path not in present]
+            for path in stale:
+                del self.records[path]
+            self.dirty = self.dirty or bool(stale)
+        return themes
+
+    def forget(self, theme_file):
+        with self.lock:
+            self.ensure_loaded()
+            if(self.records.pop(theme_file, None) is not None):
+                self.dirty = True
+
+    def save(self):
+        # Replaced in one step like the prefs file
+        with self.lock:
+            if(not self.dirty):
+                return
+            self.dirty = False
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(f"{self.path}.part", "w") as f:
+                    json.dump({"version": INDEX_VERSION, "themes": self.records}, f, separators=(",", ":"))
+                os.replace(f"{self.path}.part", self.path)
+            except OSError as e:
+                print(f"Could not save the theme index: {e}")
+
+theme_index = ThemeIndex(os.path.join(GLib.get_user_data_dir(), "theme-index.json"))
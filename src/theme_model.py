@@ -0,0 +1,91 @@
+# theme_model.py
+#
+# Copyright 2026 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+
+import os, re
+
+comment = re.compile(r'/\*.*?\*/', re.S)
+declaration = re.compile(r'--([a-zA-Z0-9_-]+)\s*:\s*([^;{}]+?)\s*;')
+reference = re.compile(r'var\(\s*--([a-zA-Z0-9_-]+)\s*(?:,\s*([^()]*))?\)|@([a-zA-Z0-9_-]+)')
+hex_color = re.compile(r'#([0-9a-fA-F]{3}|[0-9a-fA-F]{6}|[0-9a-fA-F]{8})')
+
+# path -> ((mtime, size), ThemeModel), a theme is parsed again only after its file changes
+theme_cache = {}
+
+class ThemeModel:
+    def __init__(self, path, css):
+        self.path = path
+        self.css = css
+        self.declarations = {}
+        for name, value in declaration.findall(comment.sub("", css)):
+            self.declarations[name] = value # Later declarations win, like in CSS
+
+        resolved = {}
+        for name in self.declarations:
+            self.resolve(name, resolved, set())
+        # Names whose chain ends in an undefined variable or a cycle are left out
+        self.colors = {name: resolved[name] for name in self.declarations if resolved.get(name) is not None}
+
+    def resolve(self, name, resolved, visiting):
+        # Depth first through var(--x) and @x references, every name is resolved once
+        if(name in resolved):
+            return resolved[name]
+        if(name not in self.declarations or name in visiting):
+            return None
+        visiting.add(name)
+        missing = []
+
+        def substitute(match):
+            value = self.resolve(match.group(1) or match.group(3), resolved, visiting)
+            if(value is None):
+                value = match.group(2) # var() fallback, if there is one
+            if(value is None):
+                missing.append(match.group(0))
+                return match.group(0)
+            return value.strip()
+
+        value = reference.sub(substitute, self.declarations[name])
+        visiting.discard(name)
+        resolved[name] = None if missing else value
+        return resolved[name]
+
+    def palette(self):
+        # Plain #rrggbb colors only, alpha is dropped and #rgb expanded, what the tint engine can match against
+        colors = []
+        for value in self.colors.values():
+            match = hex_color.fullmatch(value)
+            if(match is None):
+                continue
+            digits = match.group(1)
+            if(len(digits) == 3):
+                digits = "".join(c * 2 for c in digits)
+            colors.append("#" + digits[:6])
+        return colors
+
+    @classmethod
+    def load(cls, path):
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = theme_cache.get(path)
+        if(cached is not None and cached[0] == key):
+            return cached[1]
+        with open(path, "r") as f:
+            model = cls(path, f.read())
+        theme_cache[path] = (key, model)
+        return model
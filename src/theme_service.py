@@ -0,0 +1,108 @@
+# theme_service.py
+#
+# Copyright 2026 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import gi
+gi.require_version('Xdp', '1.0')
+from gi.repository import Gio, GLib, Xdp
+from .utils import Preferences, current_accent, accent_map
+from .output_files import take_output_stats
+from .theme_apply import ApplyScheduler, build_theme_state, render_theme, prerender_themes
+from .shell_reload import reset_shell, reset_shell_sync
+from .image_modifier import update_auto_tint
+
+PRERENDER_DELAY_S = 2
+
+def read_color_scheme(settings):
+    try:
+        return settings.read_uint("org.freedesktop.appearance", "color-scheme")
+    except:
+        return 1
+
+class ThemeService:
+    # The apply engine without any UI. --background keeps only this running,
+    # an open window drives the same instance and gets the provider and toasts through on_theme_rendered
+    def __init__(self):
+        self.window = None
+        self.prerender_timeout = 0
+        self.settings = Xdp.Portal().get_settings()
+        self.settings.connect("changed", self.on_settings_changed)
+        self.apply_scheduler = ApplyScheduler(self.theme_state, render_theme, self.on_theme_rendered)
+
+    def color_scheme(self):
+        return read_color_scheme(self.settings)
+
+    def theme_state(self, theme_type=None, accent=None):
+        # Only a snapshot of the saved preferences, with no arguments for the current scheme, otherwise a variant to prerender
+        prefs = Preferences().get_all()
+        if(theme_type is None):
+            theme_type = "dark" if self.color_scheme() == 1 else "light"
+        return build_theme_state(prefs, theme_type, accent or current_accent(prefs["accent"]), reset_shell)
+
+    def request(self, immediate=False):
+        self.apply_scheduler.request(immediate)
+
+    def apply_now(self):
+        # Only for a one-shot command line run, which exits right after and can't wait on the debounce or an async shell reload.
+        # A resident instance uses request() instead, so it never blocks the main loop
+        prefs = Preferences().get_all()
+        theme_type = "dark" if self.color_scheme() == 1 else "light"
+        render_theme(build_theme_state(prefs, theme_type, current_accent(prefs["accent"]), reset_shell_sync))
+        self.report_outputs()
+
+    def on_settings_changed(self, settings, namespace, key, value):
+        if(namespace == "org.freedesktop.appearance" and key == "color-scheme" or namespace == "org.gnome.desktop.interface" and key == "accent-color"):
+            self.on_appearance_changed()
+
+    def on_appearance_changed(self):
+        # Portal flips skip the debounce, with a prerendered set the apply is only a copy.
+        # It still goes through the scheduler, so it never races an apply already in flight
+        scheme = self.color_scheme()
+        if(self.window is not None):
+            self.window.pref = scheme
+        update_auto_tint(self.window, Preferences().get_all(), scheme)
+        self.request(immediate=True)
+
+    def on_theme_rendered(self, state, result):
+        if(result is None):
+            return
+        if(self.window is not None):
+            self.window.on_theme_rendered(state, result)
+        self.report_outputs()
+
+        if(self.prerender_timeout):
+            GLib.source_remove(self.prerender_timeout)
+        self.prerender_timeout = GLib.timeout_add_seconds(PRERENDER_DELAY_S, self.prerender)
+
+    def prerender(self):
+        # Both schemes, and on GNOME every accent the shell may switch to, rendered on a thread while idle
+        self.prerender_timeout = 0
+        accents = list(accent_map) if "GNOME" in (GLib.getenv("XDG_CURRENT_DESKTOP") or "") else [None]
+        states = [self.theme_state(theme_type, accent) for theme_type in ["light", "dark"] for accent in accents]
+
+        def task_func(task, source_object, task_data, cancellable):
+            prerender_themes(states)
+            task.return_boolean(True)
+
+        task = Gio.Task.new(None, None, None)
+        task.run_in_thread(task_func)
+        return GLib.SOURCE_REMOVE
+
+    def report_outputs(self):
+        stats = take_output_stats()
+        print(f"Theme applied: {stats['written']} files written, {stats['unchanged']} unchanged, {stats['shell_reloads']} shell reloads")
@@ -19,6 +19,7 @@
 
 from pathlib import Path
 from configparser import ConfigParser
+from .output_files import write_if_changed, remove_output
 
 DEFAULT_TEMPLATE = """
 :root {{
@@ -781,9 +782,9 @@ class FirefoxGnomeThemePlugin():
                     try:
                         if(Path(f"{result}/chrome/firefox-gnome-theme").exists()):
                             if result.resolve().is_dir():
-                                Path(f"{result}/chrome/firefox-gnome-theme/customChrome.css").unlink()
+                                remove_output(f"{result}/chrome/firefox-gnome-theme/customChrome.css")
                         else:
-                            Path(f"{result}/chrome/rewaitaChrome.css").unlink()
+                            remove_output(f"{result}/chrome/rewaitaChrome.css")
                     except OSError:
                         pass
             except OSError:
@@ -828,8 +829,7 @@ class FirefoxGnomeThemePlugin():
 
                             if(Path(f"{result}/chrome/firefox-gnome-theme").exists()):
                                 Path(f"{result}/chrome/firefox-gnome-theme").mkdir(mode=0o755, parents=True, exist_ok=True)
-                                with open(f"{result}/chrome/firefox-gnome-theme/customChrome.css", "w") as f:
-                                    f.write(FFG_TEMPLATE.format(**self.variables) + f"\n{extra_css}")
+                                write_if_changed(f"{result}/chrome/firefox-gnome-theme/customChrome.css", FFG_TEMPLATE.format(**self.variables) + f"\n{extra_css}")
                             else:
                                 Path(f"{result}/chrome").mkdir(mode=0o755, parents=True, exist_ok=True)
                                 Path(f"{result}/chrome/userChrome.css").touch()
@@ -840,8 +840,7 @@ class FirefoxGnomeThemePlugin():
                                         with open(f"{result}/user.js", "a") as f:
                                             f.write(pref_text)
 
-                                with open(f"{result}/chrome/rewaitaChrome.css", "w") as f:
-                                    f.write(DEFAULT_TEMPLATE.format(**self.variables) + f"\n{window_control_map[self.window_controls].format(**self.variables)}\n{extra_css}")
+                                write_if_changed(f"{result}/chrome/rewaitaChrome.css", DEFAULT_TEMPLATE.format(**self.variables) + f"\n{window_control_map[self.window_controls].format(**self.variables)}\n{extra_css}")
 
                                 with open(f"{result}/chrome/userChrome.css", "r") as rf:
                                     if("@import \"rewaitaChrome.css\";" not in rf.read()):
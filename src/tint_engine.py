@@ -0,0 +1,380 @@
+# tint_engine.py
+#
+# Copyright 2026 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import os, itertools
+
+PREVIEW_SIZE = 480
+
+def hex_to_rgb(hex_color):
+    hex_color = hex_color.lstrip('#')
+    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+
+def srgb_to_linear(c_uint8: np.ndarray) -> np.ndarray:
+    c = c_uint8 / 255.0
+    return np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+
+LINEAR_LUT = srgb_to_linear(np.arange(256)).astype(np.float32)
+
+LMS_MATRIX = np.array([
+    [0.4122214708, 0.5363325363, 0.0514459929],
+    [0.2119034982, 0.6806995451, 0.1073969566],
+    [0.0883024619, 0.2817188376, 0.6299787005],
+], dtype=np.float32)
+
+OKLAB_MATRIX = np.array([
+    [0.2104542553, 0.7936177850, -0.0040720468],
+    [1.9779984951, -2.4285922050, 0.4505937099],
+    [0.0259040371, 0.7827717662, -0.8086757660],
+], dtype=np.float32)
+
+def linear_to_oklab(rgb_lin: np.ndarray) -> np.ndarray:
+    lms = rgb_lin @ LMS_MATRIX.T
+    np.cbrt(lms, out=lms)
+    return lms @ OKLAB_MATRIX.T
+
+def to_lab(arr_uint8: np.ndarray) -> np.ndarray:
+    if(arr_uint8.dtype == np.uint8):
+        return linear_to_oklab(LINEAR_LUT[arr_uint8])
+    return linear_to_oklab(srgb_to_linear(arr_uint8).astype(np.float32))
+
+def pack_rgb(rgb_uint8: np.ndarray) -> np.ndarray:
+    rgb = rgb_uint8.reshape(-1, 3)
+    return (rgb[:, 0].astype(np.uint32) << 16) | (rgb[:, 1].astype(np.uint32) << 8) | rgb[:, 2]
+
+def unpack_rgb(codes: np.ndarray) -> np.ndarray:
+    return np.stack([codes >> 16, codes >> 8, codes], axis=1).astype(np.uint8)
+
+KMEANS_TOL = 1e-4
+
+def nearest_centroids(points: np.ndarray, centroids: np.ndarray):
+    diff = points[:, None, :] - centroids[None, :, :]
+    dists = np.einsum('ijk,ijk->ij', diff, diff)
+    labels = dists.argmin(axis=1)
+    return labels, dists[np.arange(len(points)), labels]
+
+def cluster_means(sums: np.ndarray, counts: np.ndarray, fill=None) -> np.ndarray:
+    # Empty clusters keep their value from fill, or zero
+    means = np.zeros(sums.shape, dtype=np.float32) if fill is None else np.array(fill, dtype=np.float32)
+    np.divide(sums, counts[:, None], out=means, where=counts[:, None] > 0, casting="unsafe")
+    return means
+
+def cluster_stats(points: np.ndarray, labels: np.ndarray, k: int, weights=None, fill=None):
+    # Per-cluster sums, counts and means for any channel count in one bincount over (label, channel) pairs
+    dims = points.shape[1]
+    index = (labels.astype(np.intp)[:, None] * dims + np.arange(dims)).ravel()
+    values = points if weights is None else points * np.asarray(weights, dtype=np.float64)[:, None]
+    sums = np.bincount(index, weights=values.ravel(), minlength=k * dims).reshape(k, dims)
+    counts = np.bincount(labels, weights=weights, minlength=k)
+    return sums, counts, cluster_means(sums, counts, fill)
+
+def kmeans_plus_plus(sample: np.ndarray, k: int, rng: np.random.Generator, weights=None) -> np.ndarray:
+    # Keeps each point's distance to its closest chosen centroid, so every step is O(n)
+    centroids = np.empty((k, sample.shape[1]), dtype=np.float32)
+    centroids[0] = sample[rng.integers(len(sample)) if weights is None else rng.choice(len(sample), p=weights / weights.sum())]
+    min_dists = np.einsum('ij,ij->i', sample - centroids[0], sample - centroids[0]).astype(np.float64)
+    for i in range(1, k):
+        scores = min_dists if weights is None else min_dists * weights
+        total = scores.sum()
+        if(total > 0):
+            pick = min(int(np.searchsorted(np.cumsum(scores), rng.random() * total, side="right")), len(sample) - 1)
+        else:
+            pick = rng.integers(len(sample))
+        centroids[i] = sample[pick]
+        diff = sample - centroids[i]
+        np.minimum(min_dists, np.einsum('ij,ij->i', diff, diff), out=min_dists)
+    return centroids
+
+def kmeans(sample: np.ndarray, k: int, max_iter: int, seed=None, batch_size=None, tol=KMEANS_TOL, weights=None):
+    # weights counts how many pixels each sample point stands for
+    rng = np.random.default_rng(seed)
+    if(weights is not None):
+        weights = np.asarray(weights, dtype=np.float64)
+    centroids = kmeans_plus_plus(sample, k, rng, weights)
+    stats = {"iterations": 0, "inertia": 0.0, "converged": False}
+
+    if(batch_size is None or batch_size >= len(sample)):
+        last_inertia = None
+        for iteration in range(1, max_iter + 1):
+            labels, dists = nearest_centroids(sample, centroids)
+            inertia = float(dists.sum() if weights is None else dists @ weights)
+            _sums, _counts, centroids = cluster_stats(sample, labels, k, weights, centroids)
+            stats["iterations"] = iteration
+            if(last_inertia is not None and last_inertia - inertia <= tol * last_inertia):
+                stats["converged"] = True
+                break
+            last_inertia = inertia
+    else:
+        # Mini-batch updates with a per-centroid learning rate of 1 / points seen
+        seen = np.zeros(k, dtype=np.float64)
+        smoothed = None
+        alpha = min(1.0, 2.0 * batch_size / (len(sample) + 1))
+        for iteration in range(1, max_iter + 1):
+            if(weights is None):
+                batch = sample[rng.integers(0, len(sample), batch_size)]
+            else:
+                batch = sample[rng.choice(len(sample), batch_size, p=weights / weights.sum())]
+            labels, dists = nearest_centroids(batch, centroids)
+            sums, counts, _means = cluster_stats(batch, labels, k)
+            seen += counts
+            filled = counts > 0
+            centroids[filled] += (sums[filled] - counts[filled, None] * centroids[filled]) / seen[filled, None]
+            stats["iterations"] = iteration
+
+            batch_inertia = float(dists.mean())
+            if(smoothed is not None and abs(smoothed - batch_inertia) <= tol * smoothed):
+                stats["converged"] = True
+                break
+            smoothed = batch_inertia if smoothed is None else smoothed * (1 - alpha) + batch_inertia * alpha
+
+    dists = nearest_centroids(sample, centroids)[1]
+    stats["inertia"] = float(dists.sum() if weights is None else dists @ weights)
+    return centroids, stats
+
+TILE_PIXELS = 1 << 16
+LUT_BITS = 6
+WORKERS = os.cpu_count() or 1
+
+def assign_labels(lab: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    diff = lab[:, None, :] - centroids[None, :, :]
+    return np.einsum('ijk,ijk->ij', diff, diff).argmin(axis=1)
+
+def iter_bands(height, width, tile_pixels=TILE_PIXELS):
+    # Bands of whole rows, sized so the (pixels x clusters) distance temporary stays bounded
+    rows = max(1, tile_pixels // width)
+    for top in range(0, height, rows):
+        yield top, min(top + rows, height)
+
+def stage_progress(progress, stage, start=0.0, end=1.0):
+    # progress(stage, fraction) may raise to abort the job, it is called before every tile
+    if(progress is None):
+        return None
+    return lambda fraction: progress(stage, start + (end - start) * fraction)
+
+def run_tiles(func, tiles, workers=WORKERS, progress=None):
+    # Threads share the image, centroids and tables instead of pickling them per tile,
+    # numpy releases the GIL inside the conversion, distance and gather kernels
+    tiles = list(tiles)
+    started = itertools.count()
+
+    def run(tile):
+        if(progress is not None):
+            progress(next(started) / len(tiles))
+        return func(*tile)
+
+    if(workers <= 1 or len(tiles) <= 1):
+        return [run(tile) for tile in tiles]
+    with ThreadPoolExecutor(max_workers=min(workers, len(tiles))) as pool:
+        return list(pool.map(run, tiles))
+
+def quantize_index(rgb_uint8: np.ndarray, bits: int) -> np.ndarray:
+    q = (rgb_uint8 >> (8 - bits)).astype(np.int32)
+    return (q[..., 0] << (2 * bits)) | (q[..., 1] << bits) | q[..., 2]
+
+def unique_colors(pixels, tile_pixels=TILE_PIXELS, workers=WORKERS) -> np.ndarray:
+    # Sorted distinct 24-bit colors, a presence mask over every code avoids sorting the pixels
+    height, width = pixels.shape[:2]
+    present = np.zeros(1 << 24, dtype=bool)
+
+    def mark(top, bottom):
+        present[pack_rgb(pixels[top:bottom])] = True
+
+    run_tiles(mark, iter_bands(height, width, tile_pixels), workers)
+    return np.flatnonzero(present).astype(np.uint32)
+
+def color_counts(pixels, codes, tile_pixels=TILE_PIXELS, workers=WORKERS) -> np.ndarray:
+    # Pixels per distinct color, the 2^24 table maps every code back to its index in codes
+    height, width = pixels.shape[:2]
+    index = np.zeros(1 << 24, dtype=np.int32)
+    index[codes] = np.arange(len(codes), dtype=np.int32)
+
+    def count(top, bottom):
+        return np.bincount(index[pack_rgb(pixels[top:bottom])], minlength=len(codes))
+
+    return sum(run_tiles(count, iter_bands(height, width, tile_pixels), workers))
+
+def build_code_labels(codes, centroids_lab, workers=WORKERS, progress=None) -> np.ndarray:
+    # Exact nearest centroid for only the colors present, looked up by 24-bit code
+    code_labels = np.zeros(1 << 24, dtype=np.uint8 if len(centroids_lab) <= 256 else np.uint16)
+
+    def fill(start, end):
+        code_labels[codes[start:end]] = assign_labels(to_lab(unpack_rgb(codes[start:end])), centroids_lab)
+
+    run_tiles(fill, ((start, min(start + TILE_PIXELS, len(codes))) for start in range(0, len(codes), TILE_PIXELS)), workers, progress)
+    return code_labels
+
+def build_label_lut(centroids_lab: np.ndarray, bits: int, workers=WORKERS, progress=None) -> np.ndarray:
+    # Nearest centroid for the center of every cell of a (2^bits)^3 RGB cube
+    step = 1 << (8 - bits)
+    centers = (np.arange(1 << bits) * step + step // 2).astype(np.uint8)
+    grid = np.stack(np.meshgrid(centers, centers, centers, indexing="ij"), axis=-1).reshape(-1, 3)
+    lut = np.empty(len(grid), dtype=np.uint8 if len(centroids_lab) <= 256 else np.uint16)
+
+    def fill(start, end):
+        lut[start:end] = assign_labels(to_lab(grid[start:end]), centroids_lab)
+
+    run_tiles(fill, ((start, min(start + TILE_PIXELS, len(grid))) for start in range(0, len(grid), TILE_PIXELS)), workers, progress)
+    return lut
+
+def load_pixels(image_path):
+    return np.asarray(Image.open(image_path).convert("RGB"))
+
+def load_preview_pixels(image_path, max_size=PREVIEW_SIZE):
+    img = Image.open(image_path)
+    img.draft("RGB", (max_size, max_size)) # JPEGs decode straight at 1/2, 1/4 or 1/8 scale
+    img = img.convert("RGB")
+    factor = max(img.size) // max_size
+    if(factor > 1):
+        img = img.reduce(factor)
+    return np.asarray(img)
+
+def cluster_pixels(pixels, n_colors=36, max_iter=100, sample_size=10000, seed=None, batch_size=None, lut_bits=LUT_BITS, workers=WORKERS, progress=None):
+    if(progress is not None):
+        progress("cluster", 0.0)
+    rng = np.random.default_rng(seed)
+    codes = unique_colors(pixels, workers=workers)
+    if(len(codes) <= n_colors):
+        # Every distinct color is its own cluster, exact labels are a table lookup so no LUT is needed
+        return {
+            "centroids": to_lab(unpack_rgb(codes)),
+            "stats": {"iterations": 0, "inertia": 0.0, "converged": True},
+            "lut_bits": None,
+            "label_lut": None,
+        }
+
+    if(len(codes) <= sample_size):
+        # Flat art and gradients, clustering the distinct colors weighted by pixel count beats any sample
+        weights = color_counts(pixels, codes, workers=workers)
+        centroids_lab, stats = kmeans(to_lab(unpack_rgb(codes)), n_colors, max_iter, rng, batch_size, weights=weights)
+    else:
+        # Generator.choice picks a small sample from a large image without permuting every index
+        flat = pixels.reshape(-1, 3)
+        idx = rng.choice(len(flat), size=min(sample_size, len(flat)), replace=False, shuffle=False)
+        sample = to_lab(flat[idx])
+        centroids_lab, stats = kmeans(sample, n_colors, max_iter, rng, batch_size)
+
+    # lut_bits trades accuracy for speed, None keeps the exact per-color search
+    return {
+        "centroids": centroids_lab,
+        "stats": stats,
+        "lut_bits": lut_bits,
+        "label_lut": build_label_lut(centroids_lab, lut_bits, workers, stage_progress(progress, "cluster", 0.5)) if lut_bits else None,
+    }
+
+def label_pixels(pixels, clusters, tile_pixels=TILE_PIXELS, workers=WORKERS, progress=None):
+    # Per-pixel labels and per-cluster mean RGB, neither depends on the target palette
+    height, width = pixels.shape[:2]
+    centroids_lab, label_lut, lut_bits = clusters["centroids"], clusters["label_lut"], clusters["lut_bits"]
+    n_colors = len(centroids_lab)
+    labels = np.empty((height, width), dtype=np.uint8 if n_colors <= 256 else np.uint16)
+
+    if(label_lut is None):
+        # Exact labels, the distance search only runs once per distinct color
+        code_labels = build_code_labels(unique_colors(pixels, tile_pixels, workers), centroids_lab, workers)
+
+    def label_band(top, bottom):
+        band = pixels[top:bottom].reshape(-1, 3)
+        if(label_lut is not None):
+            band_labels = label_lut[quantize_index(band, lut_bits)]
+        else:
+            band_labels = code_labels[pack_rgb(band)]
+        labels[top:bottom] = band_labels.reshape(bottom - top, width)
+        return cluster_stats(band, band_labels, n_colors)[:2]
+
+    partials = run_tiles(label_band, iter_bands(height, width, tile_pixels), workers, progress)
+    rgb_sums = sum(sums for sums, _counts in partials)
+    counts = sum(band_counts for _sums, band_counts in partials)
+    return labels, cluster_means(rgb_sums, counts)
+
+def palette_colors(clusters, target_palette_hex, blend=1.0):
+    # Output color of every cluster, the nearest palette entry mixed with the cluster's own mean
+    pal_rgb = np.array([hex_to_rgb(h) for h in target_palette_hex], dtype=np.float32)
+    pal_lab = to_lab(pal_rgb)
+
+    diff_p = clusters["centroids"][:, None, :] - pal_lab[None, :, :]
+    closest_pal_idx = np.einsum('ijk,ijk->ij', diff_p, diff_p).argmin(axis=1)
+    mapped_palette_rgb = pal_rgb[closest_pal_idx]
+
+    if(blend < 1.0):
+        blended = mapped_palette_rgb * blend + clusters["centroids_rgb"] * (1.0 - blend)
+    else:
+        blended = mapped_palette_rgb
+    return np.clip(blended, 0, 255).astype(np.uint8)
+
+def tint_labels(clusters, target_palette_hex, blend=1.0, tile_pixels=TILE_PIXELS, workers=WORKERS, progress=None):
+    # Needs only the label map, which may be a memory-mapped cache file
+    labels = clusters["labels"]
+    height, width = labels.shape
+    blended = palette_colors(clusters, target_palette_hex, blend)
+    recolored = np.empty((height, width, 3), dtype=np.uint8)
+
+    def gather_band(top, bottom):
+        recolored[top:bottom] = blended[labels[top:bottom]]
+
+    run_tiles(gather_band, iter_bands(height, width, tile_pixels), workers, progress)
+    return Image.fromarray(recolored)
+
+def tint_pixels(pixels, clusters, target_palette_hex, blend=1.0, tile_pixels=TILE_PIXELS, workers=WORKERS, progress=None):
+    height, width = pixels.shape[:2]
+    label_lut, lut_bits = clusters["label_lut"], clusters["lut_bits"]
+
+    if(label_lut is not None and blend >= 1.0 and "labels" not in clusters):
+        color_lut = palette_colors(clusters, target_palette_hex)[label_lut]
+        recolored = np.empty((height, width, 3), dtype=np.uint8)
+
+        def recolor_band(top, bottom):
+            recolored[top:bottom] = color_lut[quantize_index(pixels[top:bottom], lut_bits)]
+
+        run_tiles(recolor_band, iter_bands(height, width, tile_pixels), workers, stage_progress(progress, "assign"))
+        return Image.fromarray(recolored)
+
+    # Kept on the clusters so tinting the same image with another palette skips this pass
+    if("labels" not in clusters):
+        clusters["labels"], clusters["centroids_rgb"] = label_pixels(pixels, clusters, tile_pixels, workers, stage_progress(progress, "assign", 0.0, 0.8))
+    return tint_labels(clusters, target_palette_hex, blend, tile_pixels, workers, stage_progress(progress, "assign", 0.8))
+
+def save_clusters(path, clusters):
+    # <path>.npy holds the label map so it can be memory-mapped back, <path>.npz the per-cluster colors
+    with open(f"{path}.npz.part", "wb") as f:
+        np.savez(f, centroids=clusters["centroids"], centroids_rgb=clusters["centroids_rgb"])
+    with open(f"{path}.npy.part", "wb") as f:
+        np.save(f, clusters["labels"])
+    os.replace(f"{path}.npz.part", f"{path}.npz")
+    os.replace(f"{path}.npy.part", f"{path}.npy")
+
+def load_clusters(path):
+    if(not os.path.exists(f"{path}.npy") or not os.path.exists(f"{path}.npz")):
+        return None
+    try:
+        with np.load(f"{path}.npz") as colors:
+            clusters = {"centroids": colors["centroids"], "centroids_rgb": colors["centroids_rgb"], "label_lut": None, "lut_bits": None}
+        clusters["labels"] = np.load(f"{path}.npy", mmap_mode="r")
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Ignoring unreadable cluster cache {path}: {e}")
+        return None
+    return clusters
+
+def remap_palette(image_path, target_palette_hex, n_colors=36, blend=1.0, max_iter=100, sample_size=10000, tile_pixels=TILE_PIXELS, lut_bits=LUT_BITS, seed=None, batch_size=None, workers=WORKERS, progress=None):
+    if(progress is not None):
+        progress("decode", 0.0)
+    pixels = load_pixels(image_path)
+    clusters = cluster_pixels(pixels, n_colors, max_iter, sample_size, seed, batch_size, lut_bits, workers, progress)
+    return tint_pixels(pixels, clusters, target_palette_hex, blend, tile_pixels, workers, progress)
@@ -17,10 +17,13 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-import gi, os, shutil, json
+import gi, os, json
 from gi.repository import Gtk, Gdk, GLib, Xdp, Adw
-from .image_modifier import hex_to_rgb
+from .tint_engine import hex_to_rgb
+from .css_template import CssTemplate
 from .firefox_gnome_theme import FirefoxGnomeThemePlugin
+from .thumbnail_styles import thumbnail_styles
+from .theme_index import theme_index
 
 settings = Xdp.Portal().get_settings()
 css_provider = Gtk.CssProvider()
@@ -72,6 +75,13 @@ accent_tab_css_gs = """
 }
 """
 
+# Colors parse_gtk_theme fills into the GNOME Shell template, the GTK3 one may also use the rest of the palette
+template_colors = ["window-bg-color", "window-fg-color", "card-bg-color", "headerbar-bg-color",
+                   "accent-color", "border-color", "red-1", "panel-bg-color", "panel-fg-color",
+                   "overview-bg-color", "search-fg-color", "accent-transparent", "accent-fg-color"]
+
+accent_tab_template = CssTemplate(accent_tab_css_gs, template_colors, "accent_tab_css_gs")
+
 class Preferences:
     DEFAULTS = {
         "light-theme": "default",
@@ -90,7 +100,9 @@ class Preferences:
         "dark-panel": False,
         "trans-panel": False,
         "no-pills": False,
-        "accent": "'blue'"
+        "accent": "'blue'",
+        "auto-tint": False,
+        "tint-source": ""
     }
 
     def __init__(self):
@@ -122,34 +134,40 @@ class Preferences:
         self.save(prefs)
 
     def save(self, data):
+        # Replaced in one step, the apply thread may be reading it
         os.makedirs(self.pref_dir, exist_ok=True)
-        with open(self.pref_file, "w") as f:
+        with open(f"{self.pref_file}.part", "w") as f:
             json.dump(data, f, indent=4)
+        os.replace(f"{self.pref_file}.part", self.pref_file)
 
     def get_all(self):
         try:
             with open(self.pref_file, "r") as f:
-                return json.load(f)
+                return {**self.DEFAULTS, **json.load(f)} # Older files miss newer keys
         except:
             self.make_file()
             return dict(self.DEFAULTS)
 
-def get_accent_color(palette, win):
-    accent_map = {
-        "'blue'": "blue-1", "'teal'": "blue-2", "'green'": "green-1", "'yellow'": "yellow-1",
-        "'orange'": "orange-1", "'red'": "red-1", "'pink'": "purple-1", "'purple'": "purple-2", "'slate'": "dark-1"
-    }
+def current_accent(accent):
+    if("GNOME" in (GLib.getenv("XDG_CURRENT_DESKTOP") or "")):
+        try:
+            return str(settings.read_value("org.gnome.desktop.interface", "accent-color"))
+        except GLib.Error as e:
+            print(f"Could not read the accent color: {e}")
+    return accent
+
+accent_map = {
+    "'blue'": "blue-1", "'teal'": "blue-2", "'green'": "green-1", "'yellow'": "yellow-1",
+    "'orange'": "orange-1", "'red'": "red-1", "'pink'": "purple-1", "'purple'": "purple-2", "'slate'": "dark-1"
+}
 
-    if(win.accent_fg):
+def get_accent_color(palette, accent, light_fg):
+    if(light_fg):
         accent_fg = "#EEEEEE"
     else:
         accent_fg = "#222222"
 
-    if("GNOME" in GLib.getenv("XDG_CURRENT_DESKTOP") or ""):
-        accent = settings.read_value("org.gnome.desktop.interface", "accent-color")
-        return (palette[accent_map[str(accent)]], accent_fg)
-    else:
-        return (palette[accent_map[win.accent]], accent_fg)
+    return (palette[accent_map[accent]], accent_fg)
 
 def add_css_provider(css, accent_colors):
     Gtk.StyleContext.remove_provider_for_display(Gdk.Display.get_default(), css_provider)
@@ -162,20 +180,23 @@ def add_css_provider(css, accent_colors):
         Gdk.Display.get_default(), css_provider, Gtk.STYLE_PROVIDER_PRIORITY_USER
     )
 
-def add_gtk3_window_controls(window_controls, gtk_css):
+def gtk4_window_controls(window_controls):
     if(window_controls != "default"):
-        window_control_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "window-controls", "gtk3", window_controls + ".css")
+        window_control_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "window-controls", "gtk4", window_controls + ".css")
         with open(window_control_file, "r") as wcf:
-            css = wcf.read()
-    else:
-        css = ""
-    with open(os.path.join(os.path.expanduser("~/.config"), "gtk-3.0", "gtk.css"), "a") as file:
-        file.write(gtk_css + css)
+            return wcf.read()
+    return ""
 
-def parse_gtk_theme(colors, gnome_shell_css, theme_file, gtk3_file, reset_func):
-    prefs = Preferences()
-    all_prefs = prefs.get_all()
+def gtk3_window_controls(window_controls):
+    if(window_controls != "default"):
+        window_control_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "window-controls", "gtk3", window_controls + ".css")
+        with open(window_control_file, "r") as wcf:
+            return wcf.read()
+    return ""
 
+def parse_gtk_theme(colors, gnome_shell_template, gtk3_template, all_prefs):
+    # Fills in the derived colors and returns the GTK3 and GNOME Shell stylesheets, nothing is written here
+    outputs = {}
     if(all_prefs["window"]):
         colors["border-color"] = colors["accent-color"]
     else:
@@ -186,16 +207,15 @@ def parse_gtk_theme(colors, gnome_shell_css, theme_file, gtk3_file, reset_func):
         for color_to_replace in ["window-bg-color", "headerbar-bg-color", "card-bg-color"]:
             rgb = hex_to_rgb(colors[color_to_replace])
             colors[color_to_replace] = f"rgba({rgb[0]}, {rgb[1]}, {rgb[2]}, 0.82)"
-        gtk3_file += ".background:not(.nautilus-desktop):not(.desktopwindow) { opacity: 0.95; }"
+        gtk3_extra = ".background:not(.nautilus-desktop):not(.desktopwindow) { opacity: 0.95; }"
+    else:
+        gtk3_extra = ""
 
     if(all_prefs["light-text"]):
         colors["search-fg-color"] = "white"
     else:
         colors["search-fg-color"] = colors["window-fg-color"]
 
-    if(all_prefs["accent-tabs"]):
-        gnome_shell_css += accent_tab_css_gs
-
     if(not all_prefs["dark-panel"] and not all_prefs["trans-panel"]):
         colors["panel-bg-color"] = colors["window-bg-color"]
         colors["panel-fg-color"] = colors["window-fg-color"]
@@ -211,35 +231,18 @@ def parse_gtk_theme(colors, gnome_shell_css, theme_file, gtk3_file, reset_func):
     rgb = hex_to_rgb(colors["accent-color"])
     colors["accent-transparent"] = f"rgba({rgb[0]}, {rgb[1]}, {rgb[2]}, 0.5)"
 
-    if(all_prefs["firefox-theme"]):
-        firefox_theme_plugin.variables = colors
-        firefox_theme_plugin.window_controls = all_prefs["window-controls"]
-        firefox_theme_plugin.apply()
-    else:
-        firefox_theme_plugin.reset()
-
-    items_to_replace = ["window-bg-color", "window-fg-color", "card-bg-color", "headerbar-bg-color",
-                        "accent-color", "border-color", "red-1", "panel-bg-color", "panel-fg-color",
-                        "overview-bg-color", "search-fg-color", "accent-transparent", "accent-fg-color"]
-
     if(all_prefs["modify-gtk3-theme"]):
-        for color in colors.keys():
-            gtk3_file = gtk3_file.replace(f"@{color}", colors[color])
+        gtk3_file = gtk3_template.render(colors) + gtk3_extra
 
         if(all_prefs["sharp"]):
             gtk3_file += f"\n\n* {{border-radius: 0px;}}\n\n"
 
-        gtk3_theme_file = os.path.join(GLib.getenv("HOME"), ".config", "gtk-3.0", "gtk.css")
-        with open(gtk3_theme_file, "w") as file:
-            file.write(gtk3_file)
+        outputs["gtk3"] = gtk3_file + gtk3_window_controls(all_prefs["window-controls"])
 
-    if(all_prefs["modify-gnome-shell"] and "GNOME" in GLib.getenv("XDG_CURRENT_DESKTOP") or ""):
-        for item in items_to_replace:
-            gnome_shell_css = gnome_shell_css.replace(f"@{item}", colors[item])
-
-        gnome_shell_theme_dir = os.path.join(GLib.getenv("HOME"), ".local", "share", "themes", "rewaita", "gnome-shell")
-        os.makedirs(gnome_shell_theme_dir, exist_ok=True)
-        file = shutil.copyfile(theme_file, os.path.join(gnome_shell_theme_dir, "gnome-shell.css"))
+    if(all_prefs["modify-gnome-shell"] and "GNOME" in (GLib.getenv("XDG_CURRENT_DESKTOP") or "")):
+        gnome_shell_css = gnome_shell_template.render(colors)
+        if(all_prefs["accent-tabs"]):
+            gnome_shell_css += accent_tab_template.render(colors)
 
         if(all_prefs["sharp"]):
             gnome_shell_css += f"\n\n* {{border-radius: 0px !important;}}"
@@ -247,77 +250,51 @@ def parse_gtk_theme(colors, gnome_shell_css, theme_file, gtk3_file, reset_func):
         if(all_prefs["no-pills"]):
             gnome_shell_css += no_pill_css
 
-        with open(file, "w") as f:
-            f.write(gnome_shell_css)
-
-        reset_func()
-
-def set_to_default(gtk4_config_dir, theme_type, reset_func, extras, modify_gtk3_theme):
-    with open(os.path.join(gtk4_config_dir, "gtk.css"), "w") as file:
-        file.write(extras[0])
-
-    gnome_shell_path = os.path.join(GLib.getenv("HOME"), ".local", "share", "themes", "rewaita", "gnome-shell")
-    if(os.path.exists(os.path.join(gnome_shell_path, "gnome-shell.css"))):
-        os.remove(os.path.join(gnome_shell_path, "gnome-shell.css"))
+        outputs["gnome-shell"] = gnome_shell_css
+    return outputs
 
-    gtk_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"default-{theme_type}.css")
-    gtk_css = open(gtk_file).read()
-    add_css_provider(gtk_css + extras[0], None)
-    firefox_theme_plugin.reset()
-
-    if(modify_gtk3_theme):
-        add_gtk3_window_controls(extras[1], gtk_css)
-        
-    if("GNOME" in GLib.getenv("XDG_CURRENT_DESKTOP") or ""):
-        reset_func()
+def apply_firefox_theme(colors, all_prefs):
+    # colors is None for the default theme
+    if(colors is not None and all_prefs["firefox-theme"]):
+        firefox_theme_plugin.variables = colors
+        firefox_theme_plugin.window_controls = all_prefs["window-controls"]
+        firefox_theme_plugin.apply()
+    else:
+        firefox_theme_plugin.reset()
 
-def confirm_delete(dialog, response, button, window):
+def confirm_delete(dialog, response, item, window):
     if(response == "confirm"):
         window.toast_overlay.dismiss_all()
-        # Bear with me through this
-        window.toast_overlay.add_toast(Adw.Toast(timeout=3, title=button.theme + _(" has been deleted")))
-        button.get_parent().get_parent().remove(button.get_parent())
-        os.remove(button.path)
-
-def delete_theme(button, window):
+        window.toast_overlay.add_toast(Adw.Toast(timeout=3, title=item.name + _(" has been deleted")))
+        grid = window.dark_grid if item.theme_type == "dark" else window.light_grid
+        grid.remove(item.theme)
+        os.remove(item.path)
+        thumbnail_styles.remove(item.path)
+        theme_index.forget(item.path)
+        theme_index.save()
+
+def delete_theme(item, window):
     dialog = Adw.AlertDialog()
-    button.theme = button.theme.replace('.css', '')
-    dialog.set_heading(_("Delete") + f" {button.theme}?")
+    dialog.set_heading(_("Delete") + f" {item.name}?")
     dialog.set_body(_("Are you sure you want to delete that theme?\nThis cannot be undone."))
     
     dialog.add_response("cancel", _("Cancel"))
     dialog.add_response("confirm", _("Delete"))
     dialog.set_response_appearance("confirm", Adw.ResponseAppearance.DESTRUCTIVE)
 
-    dialog.connect("response", confirm_delete, button, window)
+    dialog.connect("response", confirm_delete, item, window)
     dialog.present(window)
     
 def delete_items(action, _, button, window):
+    # The grids style their visible tiles from this button's state, the rest are styled when they scroll in
     if(button.has_css_class("destructive-action")):
         button.remove_css_class("destructive-action")
-        for flowbox in [window.light_flowbox, window.dark_flowbox]:
-            for theme in flowbox:
-                child = theme.get_first_child()
-                if(not child.has_css_class("delete-action")):
-                    child.set_sensitive(True)
-                    window.light_button.set_sensitive(True); window.dark_button.set_sensitive(True);
-                    continue
-                child.remove_css_class("delete-action"); child.remove_css_class("shake")
-                child.disconnect_by_func(delete_theme)
-                child.connect("clicked", window.on_theme_button_clicked, child.theme, child.theme_type)
     else:
         button.add_css_class("destructive-action")
-        for flowbox in [window.light_flowbox, window.dark_flowbox]:
-            for theme in flowbox:
-                child = theme.get_first_child()
-                if(child.has_css_class("active-scheme") or child.default):
-                    child.set_sensitive(False)
-                    window.light_button.set_sensitive(False); window.dark_button.set_sensitive(False);
-                    continue
-                child.add_css_class("delete-action")
-                child.add_css_class("shake")
-                child.disconnect_by_func(child.func)
-                child.connect("clicked", delete_theme, window)
+    deleting = button.has_css_class("destructive-action")
+    window.light_button.set_sensitive(not deleting); window.dark_button.set_sensitive(not deleting)
+    for grid in [window.light_grid, window.dark_grid]:
+        grid.refresh()
 
 def change_autostart(state):
     if(state == False):
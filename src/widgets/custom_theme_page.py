@@ -2,7 +2,6 @@ import gi, shutil, os
 gi.require_version("Gtk", "4.0")
 gi.require_version('GtkSource', '5')
 from gi.repository import Gtk, Gdk, Adw, GLib, GtkSource, Gio
-from .theme_page import load_colors_from_css, create_color_thumbnail_button
 
 gnome_colors = {
     "Main Colors": {
@@ -214,26 +213,7 @@ class CustomPage(Gtk.Box):
 
         match(theme_type):
             case("light"):
-                flowbox = parent.light_flowbox
+                grid = parent.light_grid
             case("dark"):
-                flowbox = parent.dark_flowbox
-
-        colors = load_colors_from_css(theme_file)
-        new_button = create_color_thumbnail_button(colors, entry.get_text(), flowbox.snippet)
-        new_button.connect("clicked", parent.on_theme_button_clicked, entry.get_text() + ".css", theme_type)
-
-        #Attributes
-        new_button.func = parent.on_theme_button_clicked
-        new_button.path = os.path.join(parent.data_dir, theme_type, entry.get_text() + ".css")
-        new_button.theme_type = theme_type
-        new_button.theme = entry.get_text()
-        new_button.default = False
-
-        already_exists = False
-        for button in flowbox:
-            if(button.get_first_child().theme == new_button.theme):
-                already_exists = True
-
-        if(not already_exists):
-            flowbox.insert(new_button, -1)
-            flowbox.invalidate_sort()
+                grid = parent.dark_grid
+        grid.add(entry.get_text() + ".css")
@@ -141,6 +141,10 @@ keys = {
     "no-pills": "no_pills"
 }
 
+def extra_css(prefs):
+    # In row order, so the same options always give the same stylesheet
+    return "".join(css for key, label, subtitle, css in options if prefs[key])
+
 class OptionsBox(Adw.PreferencesGroup):
     def __init__(self, parent):
         super().__init__(
@@ -148,29 +152,21 @@ class OptionsBox(Adw.PreferencesGroup):
         )
         self.parent = parent
 
-        pref = Preferences()
+        prefs = Preferences().get_all() # Read once, not once per row
         for key, label, subtitle, css in options:
-            if(key == "light-text" and not "GNOME" in GLib.getenv("XDG_CURRENT_DESKTOP") or ""):
+            if(key == "light-text" and not "GNOME" in (GLib.getenv("XDG_CURRENT_DESKTOP") or "")):
                 break
 
-            active = pref.get(key)
+            active = prefs[key]
             row = Adw.SwitchRow(title=label, subtitle=subtitle, active=active)
-            row.connect("notify::active", self.on_row_toggled, css, key)
+            row.connect("notify::active", self.on_row_toggled, key)
             self.add(row)
 
-            if(active):
-                self.parent.extra_css.add(css)
-
-    def on_row_toggled(self, row, _pspec, css, key):
+    def on_row_toggled(self, row, _pspec, key):
         is_active = row.get_active()
 
         attr = keys.get(key)
         if(attr):
             setattr(self.parent, attr, is_active)
 
-        if(is_active):
-            self.parent.extra_css.add(css)
-        else:
-            self.parent.extra_css.discard(css)
-
         self.parent.on_theme_selected()
@@ -17,16 +17,30 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from gi.repository import Adw, Gtk, GLib
+from gi.repository import Adw, Gtk
+
+# Share of the whole bar given to each stage of a tint
+stages = {
+    "decode": (0.0, 0.1),
+    "cluster": (0.1, 0.3),
+    "assign": (0.3, 0.9),
+    "encode": (0.9, 1.0),
+}
 
 class LoadingDialog(Adw.Dialog):
-    def __init__(self, parent):
+    def __init__(self, parent, on_cancel=None):
         super().__init__(can_close=False)
 
         box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=12, margin_top=24, margin_bottom=24, margin_start=24, margin_end=24, valign=Gtk.Align.CENTER, halign=Gtk.Align.CENTER)
 
-        self.spinner = Gtk.ProgressBar(margin_top=12, pulse_step=0.5)
-        GLib.timeout_add(500, self.pulse)
+        self.stage_labels = {
+            "decode": _("Reading image"),
+            "cluster": _("Finding colors"),
+            "assign": _("Recoloring"),
+            "encode": _("Saving"),
+        }
+
+        self.spinner = Gtk.ProgressBar(margin_top=12, show_text=True)
 
         label = Gtk.Label(label=_("This may take a moment"))
         label.add_css_class("title-4")
@@ -34,11 +48,15 @@ class LoadingDialog(Adw.Dialog):
         box.append(label)
         box.append(self.spinner)
 
-        self.set_child(box)
-
-    def pulse(self):
-        self.spinner.pulse()
-        return True
-
+        if(on_cancel is not None):
+            cancel_button = Gtk.Button(label=_("Cancel"), halign=Gtk.Align.CENTER, margin_top=12)
+            cancel_button.add_css_class("pill")
+            cancel_button.connect("clicked", lambda b : on_cancel())
+            box.append(cancel_button)
 
+        self.set_child(box)
 
+    def set_progress(self, stage, fraction):
+        start, end = stages[stage]
+        self.spinner.set_fraction(start + (end - start) * min(fraction, 1.0))
+        self.spinner.set_text(self.stage_labels[stage])
@@ -2,13 +2,15 @@ import gi, os, shutil
 from gi.repository import Gtk, Adw, GLib, Xdp
 from .extra_options_box import OptionsBox
 from .accent_box import AccentBox
-from .utils import change_autostart
+from .utils import change_autostart, Preferences
+from .image_modifier import update_auto_tint
+from .shell_reload import reset_shell
 
 class PrefPage(Gtk.Box):
     def __init__(self, win):
         super().__init__(orientation=Gtk.Orientation.VERTICAL, valign=Gtk.Align.CENTER, spacing=32, margin_start=12, margin_end=12)
 
-        if(not "GNOME" in GLib.getenv("XDG_CURRENT_DESKTOP") or ""):
+        if(not "GNOME" in (GLib.getenv("XDG_CURRENT_DESKTOP") or "")):
             self.append(Adw.Clamp(maximum_size=800, child=AccentBox(win)))
         self.append(OptionsBox(win))
         prefs_page = Adw.PreferencesGroup()
@@ -21,7 +23,8 @@ class PrefPage(Gtk.Box):
             ("Generate GTK-3.0 Theme", "Highly recommended for all users"),
             ("Generate GNOME Shell Theme", "For GNOME users"),
             ("Generate Firefox CSS Theme", "May conflict with existing theme"),
-            ("Run in background", "For users who swap between light/dark mode")
+            ("Run in background", "For users who swap between light/dark mode"),
+            ("Re-tint wallpaper automatically", "Keeps the last tinted wallpaper matched to the current theme")
         ]:
             if(title[0] == "Generate GTK-3.0 Theme"):
                 state = win.modify_gtk3_theme
@@ -32,9 +35,12 @@ class PrefPage(Gtk.Box):
             elif(title[0] == "Generate Firefox CSS Theme"):
                 state = win.firefox_theme
                 def state_function(value): win.firefox_theme = value
-            else:
+            elif(title[0] == "Run in background"):
                 state = win.run_in_background
                 def state_function(value): win.run_in_background = value
+            else:
+                state = win.auto_tint
+                def state_function(value): win.auto_tint = value
             row = Adw.SwitchRow(title=_(title[0]), subtitle=_(title[1]), active=state)
             row.connect("notify::active", self.on_pref_toggle_switched, title[0], win, state_function)
             toggle_group.add(row)
@@ -54,6 +60,8 @@ class PrefPage(Gtk.Box):
             self.clear_gnome_shell(state, win)
         elif(title == "Run in background"):
             change_autostart(state)
+        elif(title == "Re-tint wallpaper automatically"):
+            update_auto_tint(win, Preferences().get_all(), win.pref)
         else:
             win.on_theme_selected()
 
@@ -70,7 +78,6 @@ class PrefPage(Gtk.Box):
                 print('Failed to clear folder: ' + e)
 
     def clear_gnome_shell(self, state, win):
-        from .window import reset_shell
         if(not state):
             folder_path = os.path.join(GLib.getenv("HOME"), ".local", "share", "themes", "rewaita", "gnome-shell")
             if(os.path.exists(folder_path)):
@@ -17,74 +17,219 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-import gi, os, re
-from gi.repository import Gtk, Adw, Gdk, GLib
+import gi, os
+from gi.repository import Gtk, Adw, GLib, Gio, GObject
 from fortune import fortune
 from .wallpaper_dialog import WallpaperDialog
+from .theme_index import theme_index
+from .thumbnail_styles import thumbnail_styles
+from .utils import delete_theme
 
-def flowbox_sort_func(child1: Gtk.FlowBoxChild, child2: Gtk.FlowBoxChild, _):
-    button1 = child1.get_first_child()
-    button2 = child2.get_first_child()
-
-    theme1 = button1.theme.lower()
-    theme2 = button2.theme.lower()
-
-    if(theme1 < theme2):
-        return -1
-    elif(theme1 > theme2):
-        return 1
-    return 0
-
-def load_colors_from_css(file_path):
-    colors = {}
-    color_pattern = re.compile(r'--([a-z0-9-]+)\s*:\s*(#[a-fA-F0-9]+|(?!var\()[a-z0-9_-]+(?:\([^)]*\))?)\s*;')
-
-    with open(file_path, "r") as f:
-        for line in f:
-            match = color_pattern.search(line)
-            if(match):
-                name, color = match.groups()
-                if(color.startswith('var')):
-                    continue
-                colors[name] = color.strip()
-    return colors
-
-def create_color_thumbnail_button(colors, name, example_text):
-    button = Gtk.Button()
-    box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
-    dots = Gtk.Label(vexpand=True, valign=Gtk.Align.END, use_markup=True)
+GRID_MAX_HEIGHT = 720
+LIBRARY_DELAY_MS = 300
+library_events = [
+    Gio.FileMonitorEvent.CREATED, Gio.FileMonitorEvent.CHANGED, Gio.FileMonitorEvent.CHANGES_DONE_HINT,
+    Gio.FileMonitorEvent.DELETED, Gio.FileMonitorEvent.MOVED_IN, Gio.FileMonitorEvent.MOVED_OUT, Gio.FileMonitorEvent.RENAMED,
+]
+
+def thumbnail_dots(swatches):
     dot_txt = ""
+    for color in swatches:
+        dot_txt += f"<span font_size='20pt' foreground='{color}'> ● </span>"
+    return dot_txt
 
-    keys_to_show = ["red-1", "orange-1", "yellow-1", "green-1", "blue-1", "dark-1", "light-1"]
-    for key in keys_to_show:
-        color = colors.get(key)
-        if(color):
-            dot_txt += f"<span font_size='20pt' foreground='{color}'> ● </span>"
-
-    dots.set_label(dot_txt)
-    rand = os.urandom(15).hex()
-    css_provider = Gtk.CssProvider()
-    css_provider.load_from_data(f"""
-        .background-{rand} {{
-            background-color: {colors.get("window-bg-color")};
-            color: {colors.get("window-fg-color")};
-        }}
-    """.encode())
-    Gtk.StyleContext.add_provider_for_display(
-        Gdk.Display.get_default(), css_provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION
-    )
-    button.add_css_class(f'background-{rand}')
+def create_thumbnail_button(example_text):
+    # The empty tile, fill_thumbnail_button puts a theme in it and can be called again to reuse it
+    button = Gtk.Button()
+    box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+    button.dots = Gtk.Label(vexpand=True, valign=Gtk.Align.END, use_markup=True)
 
     example = Gtk.Label(wrap=True, margin_top=12, margin_bottom=12, hexpand=True, vexpand=True, valign=Gtk.Align.CENTER, halign=Gtk.Align.CENTER, max_width_chars=12)
     example.set_markup(f"<i><b>{example_text}</b></i>")
     box.prepend(example)
-    title = Gtk.Label(margin_bottom=12, margin_top=12, label=name)
-    title.set_css_classes(["monospace", "title-2"])
-    box.prepend(title)
-    box.append(dots)
+    button.title = Gtk.Label(margin_bottom=12, margin_top=12)
+    button.title.set_css_classes(["monospace", "title-2"])
+    box.prepend(button.title)
+    box.append(button.dots)
     button.set_child(box)
+    button.thumbnail_class = None
     return button
 
+def fill_thumbnail_button(button, record, thumbnail_class):
+    # thumbnail_class is the theme's rule in thumbnail_styles, added when its item was made
+    button.title.set_label(record["name"])
+    button.dots.set_label(thumbnail_dots(record["swatches"]))
+    if(button.thumbnail_class):
+        button.remove_css_class(button.thumbnail_class)
+    button.thumbnail_class = thumbnail_class
+    button.add_css_class(button.thumbnail_class)
+
+class ThemeItem(GObject.Object):
+    __gtype_name__ = "RewaitaThemeItem"
+
+    name = GObject.Property(type=str) # What the grid sorts on
+
+    def __init__(self, theme, theme_type, path, record, default):
+        super().__init__(name=record["name"])
+        self.theme = theme
+        self.theme_type = theme_type
+        self.path = path
+        self.record = record # From the theme index, the file is not parsed here
+        self.default = default
+        self.thumbnail_class = None
+
+class ThemeGrid(Gtk.ScrolledWindow):
+    # Only the visible tiles exist as widgets, they are rebound as the grid scrolls.
+    # Active and delete mode styling is worked out from the window whenever a tile is bound or refresh() runs
+    def __init__(self, window, theme_type, snippet):
+        super().__init__(hscrollbar_policy=Gtk.PolicyType.NEVER, propagate_natural_height=True, max_content_height=GRID_MAX_HEIGHT)
+        self.window = window
+        self.theme_type = theme_type
+        self.snippet = snippet
+        self.items = {} # theme file name -> ThemeItem
+        self.tiles = set()
+        self.theme_dir = os.path.join(window.data_dir, theme_type)
+        self.monitor = None
+        self.pending_changes = set()
+        self.changes_timeout = 0
+
+        self.store = Gio.ListStore(item_type=ThemeItem)
+        sorter = Gtk.StringSorter(expression=Gtk.PropertyExpression.new(ThemeItem, None, "name"))
+        model = Gtk.NoSelection(model=Gtk.SortListModel(model=self.store, sorter=sorter))
+
+        factory = Gtk.SignalListItemFactory()
+        factory.connect("setup", self.on_setup)
+        factory.connect("bind", self.on_bind)
+        factory.connect("unbind", self.on_unbind)
+
+        grid = Gtk.GridView(model=model, factory=factory, max_columns=3, margin_start=6, margin_end=6)
+        grid.add_css_class("theme-grid")
+        self.set_child(grid)
+
+    def make_item(self, theme, record, default=False):
+        path = os.path.join(self.theme_dir, theme)
+        item = ThemeItem(theme, self.theme_type, path, record, default)
+        # Rules go in as the list is built, one reload for the whole batch, so binding while scrolling never reloads the stylesheet
+        item.thumbnail_class = thumbnail_styles.set(path, record["background"], record["foreground"])
+        return item
+
+    def load(self, themes, defaults=()):
+        # themes is [(file name, index record)], one splice so the grid sorts and lays out once however many there are
+        items = [self.make_item(theme, record, theme in defaults) for theme, record in themes]
+        for item in items:
+            self.items[item.theme] = item
+        self.store.splice(self.store.get_n_items(), 0, items)
+
+    def add(self, theme, default=False):
+        # A theme that is already listed is replaced, so a re-saved theme picks up its new colors
+        self.remove(theme)
+        record = theme_index.record(os.path.join(self.theme_dir, theme))
+        theme_index.save()
+        item = self.make_item(theme, record, default)
+        self.items[theme] = item
+        self.store.append(item)
+
+    def remove(self, theme):
+        item = self.items.pop(theme, None)
+        if(item is None):
+            return
+        found, position = self.store.find(item)
+        if(found):
+            self.store.remove(position)
+
+    def watch(self):
+        # Themes copied in by hand or by a sync tool show up without a restart
+        self.monitor = Gio.File.new_for_path(self.theme_dir).monitor_directory(Gio.FileMonitorFlags.WATCH_MOVES, None)
+        self.monitor.connect("changed", self.on_library_changed)
+        self.connect("destroy", lambda grid: self.monitor.cancel())
+
+    def on_library_changed(self, monitor, file, other_file, event):
+        if(event not in library_events):
+            return
+        for changed in [file, other_file]: # other_file is the new name of a rename
+            if(changed is not None and not changed.get_basename().startswith(".")):
+                self.pending_changes.add(changed.get_basename())
+
+        # Waits for a quiet moment, so a bulk copy is one update
+        if(self.changes_timeout):
+            GLib.source_remove(self.changes_timeout)
+        self.changes_timeout = GLib.timeout_add(LIBRARY_DELAY_MS, self.apply_library_changes)
+
+    def apply_library_changes(self):
+        # Only the files named by events are looked at, unchanged ones keep their item and tile
+        self.changes_timeout = 0
+        changes, self.pending_changes = self.pending_changes, set()
+        added = []
+        for theme in changes:
+            path = os.path.join(self.theme_dir, theme)
+            try:
+                record = theme_index.record(path)
+            except (OSError, ValueError): # Gone, or caught halfway through being written
+                record = None
+            item = self.items.get(theme)
+            if(item is not None and item.record is record):
+                continue
+
+            self.remove(theme)
+            if(record is None):
+                theme_index.forget(path)
+                thumbnail_styles.remove(path)
+                continue
+            new_item = self.make_item(theme, record, item.default if item is not None else False)
+            self.items[theme] = new_item
+            added.append(new_item)
+
+        self.store.splice(self.store.get_n_items(), 0, added)
+        theme_index.save()
+        return GLib.SOURCE_REMOVE
+
+    def on_setup(self, factory, list_item):
+        button = create_thumbnail_button(self.snippet)
+        button.item = None
+        button.connect("clicked", self.on_tile_clicked)
+        list_item.set_child(button)
+
+    def on_bind(self, factory, list_item):
+        button = list_item.get_child()
+        item = list_item.get_item()
+        button.item = item
+        fill_thumbnail_button(button, item.record, item.thumbnail_class)
+        self.tiles.add(button)
+        self.update_tile(button)
+
+    def on_unbind(self, factory, list_item):
+        button = list_item.get_child()
+        button.item = None
+        self.tiles.discard(button)
+
+    def active_theme(self):
+        return self.window.dark_theme if self.theme_type == "dark" else self.window.light_theme
+
+    def update_tile(self, button):
+        item = button.item
+        active = item.theme == self.active_theme()
+        deleting = self.window.delete_button.has_css_class("destructive-action")
+        locked = deleting and (active or item.default)
+        button.set_sensitive(not locked)
+        for css_class, enabled in [("active-scheme", active), ("delete-action", deleting and not locked), ("shake", deleting and not locked)]:
+            if(enabled):
+                button.add_css_class(css_class)
+            else:
+                button.remove_css_class(css_class)
+
+    def refresh(self):
+        for button in self.tiles:
+            self.update_tile(button)
+
+    def on_tile_clicked(self, button):
+        item = button.item
+        if(item is None):
+            return
+        if(button.has_css_class("delete-action")):
+            delete_theme(item, self.window)
+        else:
+            self.window.on_theme_button_clicked(button, item.theme, item.theme_type)
+
 def symlink_all_in_dir(src, out):
     os.makedirs(out, exist_ok=True)
 
@@ -126,15 +271,13 @@ class ThemePage(Gtk.Box):
             default_theme_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), theme_type)
             default_themes = os.listdir(default_theme_path)
             symlink_all_in_dir(default_theme_path, os.path.join(GLib.get_user_data_dir(), theme_type))
-            themes = os.listdir(os.path.join(parent.data_dir, theme_type))
 
+            grid = ThemeGrid(parent, theme_type, snippet)
             if(theme_type == "light"):
-                parent.light_flowbox = Gtk.FlowBox(column_spacing=12, row_spacing=12, max_children_per_line=3, homogeneous=True, margin_start=12, margin_end=12, selection_mode=Gtk.SelectionMode.NONE)
-                flowbox = parent.light_flowbox
+                parent.light_grid = grid
                 parent.light_button = reset_button
             else:
-                parent.dark_flowbox = Gtk.FlowBox(column_spacing=12, row_spacing=12, max_children_per_line=3, homogeneous=True, margin_start=12, margin_end=12, selection_mode=Gtk.SelectionMode.NONE)
-                flowbox = parent.dark_flowbox
+                parent.dark_grid = grid
                 parent.dark_button = reset_button
 
             title_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, halign=Gtk.Align.CENTER)
@@ -143,34 +286,10 @@ class ThemePage(Gtk.Box):
             title_box.append(title); title_box.append(reset_button)
             self.append(title_box)
 
-            flowbox.snippet = snippet
-            for theme in sorted(themes):
-                file_path = os.path.join(parent.data_dir, theme_type, theme)
-
-                if(not os.path.exists(file_path)):
-                    continue
-
-                colors = load_colors_from_css(file_path)
-                btn = create_color_thumbnail_button(colors, theme.replace(".css", ""), flowbox.snippet)
-                btn.connect("clicked", parent.on_theme_button_clicked, theme, theme_type)
-
-                if(theme == parent.dark_theme and theme_type == "dark" or theme == parent.light_theme and theme_type == "light"):
-                    btn.add_css_class("active-scheme")
-                if(theme in default_themes):
-                    btn.default = True
-                else:
-                    btn.default = False
-
-                #Attributes
-                btn.path = os.path.join(parent.data_dir, theme_type, theme)
-                btn.func = parent.on_theme_button_clicked
-                btn.theme = theme
-                btn.theme_type = theme_type
-
-                flowbox.append(btn)
-
-            flowbox.set_sort_func(flowbox_sort_func, None)
-            self.append(Adw.Clamp(maximum_size=900, child=flowbox))
+            grid.load(theme_index.scan(grid.theme_dir), default_themes)
+            grid.watch()
+            self.append(Adw.Clamp(maximum_size=900, child=grid))
+        theme_index.save()
 
     def get_example_text(self):
         while(True):
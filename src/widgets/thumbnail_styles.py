@@ -0,0 +1,64 @@
+# thumbnail_styles.py
+#
+# Copyright 2026 Nathan Perlman
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import hashlib
+from gi.repository import Gtk, Gdk, GLib
+
+class ThumbnailStyles:
+    # One provider for every theme thumbnail, with a stable class per theme file.
+    # Changes are batched into a single reload that runs before the next frame, so loading a whole library is one parse
+    def __init__(self):
+        self.rules = {}
+        self.provider = None
+        self.reload_source = 0
+
+    def class_name(self, path):
+        return "theme-" + hashlib.sha1(path.encode()).hexdigest()[:16]
+
+    def set(self, path, background, foreground):
+        name = self.class_name(path)
+        declarations = ""
+        for prop, value in [("background-color", background), ("color", foreground)]:
+            if(value):
+                declarations += f" {prop}: {value};"
+        rule = f".{name} {{{declarations} }}\n"
+        if(self.rules.get(name) != rule):
+            self.rules[name] = rule
+            self.queue_reload()
+        return name
+
+    def remove(self, path):
+        if(self.rules.pop(self.class_name(path), None) is not None):
+            self.queue_reload()
+
+    def queue_reload(self):
+        if(not self.reload_source):
+            self.reload_source = GLib.idle_add(self.reload, priority=GLib.PRIORITY_HIGH_IDLE)
+
+    def reload(self):
+        self.reload_source = 0
+        if(self.provider is None):
+            self.provider = Gtk.CssProvider()
+            Gtk.StyleContext.add_provider_for_display(
+                Gdk.Display.get_default(), self.provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION
+            )
+        self.provider.load_from_data("".join(self.rules.values()).encode())
+        return GLib.SOURCE_REMOVE
+
+thumbnail_styles = ThumbnailStyles()
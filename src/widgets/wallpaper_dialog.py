@@ -19,13 +19,19 @@
 
 import os
 from gi.repository import Adw, Gtk, Gio, Gdk, GLib
-from .image_modifier import on_image_opened, make_new_image
+from .image_modifier import make_new_image, theme_palette, PREVIEW_PARAMS
+from .tint_engine import load_preview_pixels, cluster_pixels, tint_pixels
 
 picture_path = os.path.join(GLib.get_user_data_dir(), "wallpapers")
 
 class WallpaperDialog(Adw.Dialog):
     def __init__(self, parent):
         super().__init__()
+        self.parent = parent
+        self.file_path = None
+        self.preview = None
+        self.themes = []
+
         page = Gtk.Box(hexpand=True, vexpand=True, orientation=Gtk.Orientation.VERTICAL)
         message_area = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=12, margin_bottom=24, margin_start=24, margin_end=24, valign=Gtk.Align.CENTER, halign=Gtk.Align.CENTER)
         page.append(Adw.HeaderBar())
@@ -33,9 +39,16 @@ class WallpaperDialog(Adw.Dialog):
 
         def on_drop_file(target, value, x, y):
             file_path = value.get_path() or value.get_uri()
-            make_new_image(parent, file_path)
+            self.show_preview(file_path)
             return True
 
+        def on_image_opened(file_dialog, result):
+            try:
+                file = file_dialog.open_finish(result)
+            except GLib.Error:
+                return
+            self.show_preview(file.get_path())
+
         def on_open_image(button):
             file_filter_image = Gtk.FileFilter()
             file_filter_image.set_name("Image files")
@@ -44,7 +57,7 @@ class WallpaperDialog(Adw.Dialog):
             file_filter_image.add_mime_type("image/jpeg")
             file_filter_image.add_mime_type("image/webp")
             file_dialog = Gtk.FileDialog(default_filter=file_filter_image)
-            file_dialog.open(parent, None, on_image_opened, parent)
+            file_dialog.open(parent, None, on_image_opened)
 
         file_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8, hexpand=True, halign=Gtk.Align.CENTER, margin_top=20)
 
@@ -76,4 +89,82 @@ class WallpaperDialog(Adw.Dialog):
         drop_area.add_controller(drop_target)
 
         message_area.append(drop_area)
+
+        # Draft tint of a downscaled copy, the full resolution one only runs once confirmed
+        self.preview_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=12, visible=False)
+        self.picture = Gtk.Picture(content_fit=Gtk.ContentFit.CONTAIN, height_request=220)
+        self.picture.add_css_class("card")
+        self.preview_box.append(self.picture)
+
+        self.theme_dropdown = Gtk.DropDown(halign=Gtk.Align.CENTER)
+        self.theme_dropdown.connect("notify::selected", lambda *_args : self.render_preview())
+        self.preview_box.append(self.theme_dropdown)
+
+        self.apply_button = Gtk.Button(label=_("Set Wallpaper"), halign=Gtk.Align.CENTER, sensitive=False)
+        self.apply_button.set_css_classes(["suggested-action", "pill"])
+        self.apply_button.connect("clicked", self.on_apply_clicked)
+        self.preview_box.append(self.apply_button)
+
+        message_area.append(self.preview_box)
         self.set_child(page)
+
+    def refresh_themes(self):
+        theme_type = "light" if self.parent.pref in [0, 2] else "dark"
+        current = self.parent.light_theme if theme_type == "light" else self.parent.dark_theme
+        theme_dir = os.path.join(self.parent.data_dir, theme_type)
+        names = sorted((theme for theme in os.listdir(theme_dir) if os.path.exists(os.path.join(theme_dir, theme))), key=str.lower)
+        self.themes = [os.path.join(theme_dir, theme) for theme in names]
+
+        self.theme_dropdown.set_model(Gtk.StringList.new([theme.replace(".css", "") for theme in names]))
+        if(current in names):
+            self.theme_dropdown.set_selected(names.index(current))
+
+    def selected_theme_file(self):
+        selected = self.theme_dropdown.get_selected()
+        if(selected == Gtk.INVALID_LIST_POSITION or selected >= len(self.themes)):
+            return None
+        return self.themes[selected]
+
+    def show_preview(self, file_path):
+        self.file_path = file_path
+        self.preview = None
+        self.apply_button.set_sensitive(False)
+        self.refresh_themes()
+        self.preview_box.set_visible(True)
+        results = {}
+
+        def task_func(task, source_object, task_data, cancellable):
+            try:
+                pixels = load_preview_pixels(file_path)
+                results["preview"] = (pixels, cluster_pixels(pixels, workers=1, **PREVIEW_PARAMS))
+            except OSError as e:
+                print(f"Could not preview {file_path}: {e}")
+            task.return_boolean(True)
+
+        def on_done(task, result, user_data=None):
+            if(self.file_path != file_path or "preview" not in results): # A newer image was dropped meanwhile
+                return
+            self.preview = results["preview"]
+            self.render_preview()
+
+        task = Gio.Task.new(None, None, on_done)
+        task.run_in_thread(task_func)
+
+    def render_preview(self):
+        theme_file = self.selected_theme_file()
+        if(self.preview is None or theme_file is None):
+            return
+
+        # Only the palette match and a gather run here, switching themes stays interactive
+        pixels, clusters = self.preview
+        img = tint_pixels(pixels, clusters, theme_palette(theme_file), workers=1)
+        texture = Gdk.MemoryTexture.new(img.width, img.height, Gdk.MemoryFormat.R8G8B8, GLib.Bytes.new(img.tobytes()), img.width * 3)
+        self.picture.set_paintable(texture)
+        self.apply_button.set_sensitive(True)
+
+    def on_apply_clicked(self, button):
+        theme_file = self.selected_theme_file()
+        if(self.file_path is None or theme_file is None):
+            return
+        self.close()
+        make_new_image(self.parent, self.file_path, theme_file)
@@ -17,46 +17,17 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-import os, shutil, gi, re
-gi.require_version('Xdp', '1.0')
-from gi.repository import Adw, Gdk, Gio, GLib, Gtk, Xdp
-from collections import defaultdict
-from .utils import parse_gtk_theme, set_to_default, delete_items, get_accent_color, add_gtk3_window_controls, add_css_provider, Preferences
-from .custom_theme_page import CustomPage
+import os, gi
+from gi.repository import Adw, Gdk, Gio, GLib, Gtk
+from .utils import delete_items, add_css_provider, Preferences
 from .theme_page import ThemePage
-from .pref_page import PrefPage
 from .window_control_box import WindowControlBox
-
-def read_color_scheme(settings):
-    try:
-        return settings.read_uint("org.freedesktop.appearance", "color-scheme")
-    except:
-        return 1
-
-if("GNOME" in GLib.getenv("XDG_CURRENT_DESKTOP" or "")):
-    bus = Gio.bus_get_sync(Gio.BusType.SESSION, None)
-    proxy = Gio.DBusProxy.new_sync(
-        bus,
-        Gio.DBusProxyFlags.NONE,
-        None,
-        'org.gnome.Shell.Extensions',
-        '/org/gnome/Shell/Extensions',
-        'org.gnome.Shell.Extensions',
-        None
-    )
-
-def reset_shell():
-    proxy.call_sync("DisableExtension",
-        GLib.Variant("(s)", ("user-theme@gnome-shell-extensions.gcampax.github.com",)),
-        Gio.DBusCallFlags.NONE, -1, None)
-
-    proxy.call_sync("EnableExtension",
-        GLib.Variant("(s)", ("user-theme@gnome-shell-extensions.gcampax.github.com",)),
-        Gio.DBusCallFlags.NONE, -1, None)
+from .image_modifier import update_auto_tint
 
 gtk3_config_dir = os.path.join(os.path.expanduser("~/.config"), "gtk-3.0")
 gtk4_config_dir = os.path.join(os.path.expanduser("~/.config"), "gtk-4.0")
 gnome_shell_dir = os.path.join(GLib.getenv("HOME"), ".local", "share", "themes")
+app_styles = {"provider": None}
 
 @Gtk.Template(resource_path='/io/github/swordpuffin/rewaita/window.ui')
 class RewaitaWindow(Adw.ApplicationWindow):
@@ -67,9 +38,7 @@ class RewaitaWindow(Adw.ApplicationWindow):
     toast_overlay = Gtk.Template.Child()
     delete_button = Gtk.Template.Child()
     endbox = Gtk.Template.Child()
-    extra_css = set()
 
-    window_control_css = ""
     light_theme = ""
     dark_theme = ""
     pref = 0
@@ -78,11 +47,13 @@ class RewaitaWindow(Adw.ApplicationWindow):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
-        css_provider = Gtk.CssProvider()
-        css_provider.load_from_data(open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "styles.css")).read())
-        Gtk.StyleContext.add_provider_for_display(
-            Gdk.Display.get_default(), css_provider, Gtk.STYLE_PROVIDER_PRIORITY_USER
-        )
+        # Windows are rebuilt every time one is opened from the background, the display only needs the stylesheet once
+        if(app_styles["provider"] is None):
+            app_styles["provider"] = Gtk.CssProvider()
+            app_styles["provider"].load_from_data(open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "styles.css")).read())
+            Gtk.StyleContext.add_provider_for_display(
+                Gdk.Display.get_default(), app_styles["provider"], Gtk.STYLE_PROVIDER_PRIORITY_USER
+            )
 
         #Makes necessary directories
         for path in [gtk3_config_dir, gtk4_config_dir, gnome_shell_dir]:
@@ -92,11 +63,10 @@ class RewaitaWindow(Adw.ApplicationWindow):
         delete.connect("activate", delete_items, self.delete_button, self)
         self.add_action(delete)
 
-        if(self.window_control != "default"):
-            self.window_control_css = open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "window-controls", "gtk4", f"{self.window_control}.css")).read()
-        self.portal = Xdp.Portal()
-        self.settings = self.portal.get_settings()
-        self.pref = read_color_scheme(self.settings)
+        # Applies go through the application's theme service, which outlives this window in the background
+        self.service = self.get_application().theme_service
+        self.service.window = self
+        self.pref = self.service.color_scheme()
 
         scroll_box = Gtk.ScrolledWindow(hexpand=True)
         self.main_box.append(scroll_box)
@@ -104,103 +74,52 @@ class RewaitaWindow(Adw.ApplicationWindow):
         self.controls = self.endbox.get_parent().get_last_child() #Gets the window controls
         self.theme_page = ThemePage(self)
         self.theme_page.append(WindowControlBox(self, self.window_control))
-        self.custom_page = CustomPage(self)
 
         stack = Adw.ViewStack(transition_duration=200, vhomogeneous=False)
         stack.connect("notify::visible-child", self.on_page_changed)
         self.switcher.set_stack(stack)
         stack.add_titled_with_icon(self.theme_page, "theming", _("Theming"), "brush-symbolic")
-        stack.add_titled_with_icon(Adw.Clamp(child=self.custom_page, maximum_size=850), "custom", _("Custom"), "hammer-symbolic")
-        stack.add_titled_with_icon(Adw.Clamp(child=PrefPage(self), maximum_size=850), "pref", _("Fine Tune"), "emblem-system-symbolic")
+        # Filled in the first time they are shown, most launches never leave the theming page
+        stack.add_titled_with_icon(Adw.Clamp(maximum_size=850), "custom", _("Custom"), "hammer-symbolic")
+        stack.add_titled_with_icon(Adw.Clamp(maximum_size=850), "pref", _("Fine Tune"), "emblem-system-symbolic")
 
         box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
         box.append(stack)
         scroll_box.set_child(box)
 
     def on_page_changed(self, stack, _):
+        page = stack.get_visible_child()
+        if(stack.get_visible_child_name() != "theming" and page.get_child() is None):
+            page.set_child(self.build_page(stack.get_visible_child_name()))
+
         if(stack.get_visible_child_name() != "theming"):
             self.delete_button.set_visible(False)
         else:
             self.delete_button.set_visible(True)
 
-    template_file_content = open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "gnome-shell-template.css")).read()
-    gtk3_template_file_content = open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "gtk3-template", "gtk.css")).read()
+    def build_page(self, name):
+        # Imported on first use as well, the custom page pulls in GtkSourceView
+        if(name == "custom"):
+            from .custom_theme_page import CustomPage
+            self.custom_page = CustomPage(self)
+            return self.custom_page
+        from .pref_page import PrefPage
+        return PrefPage(self)
 
     def on_theme_selected(self):
-        self.pref = read_color_scheme(self.settings)
-        if(self.pref == 1):
-            theme_name = self.dark_theme
-            theme_type = "dark"
-        else:
-            theme_name = self.light_theme
-            theme_type = "light"
+        self.save_prefs() # The service reads the saved preferences, not this window
+        self.service.request()
 
-        self.save_prefs()
-
-        extra_css_string = ""
-        for item in self.extra_css:
-            extra_css_string += item
-        extras = self.window_control_css + extra_css_string
-        if(theme_name == "default"):
-            set_to_default(gtk4_config_dir, theme_type, reset_shell, [extras, self.window_control], self.modify_gtk3_theme)
+    def on_theme_rendered(self, state, result):
+        if(result is None):
             return
-
-        theme_file = os.path.join(self.data_dir, theme_type, theme_name)
-        self.controls.set_css_classes([self.window_control])
-
-        try: # I'd rather it just not do anything than fail, it's this stupid symlink system I have going on
-            gtk_css = open(theme_file).read()
-        except FileNotFoundError:
-            print(f"Could not find: {theme_file}")
-            return
-
-        self.toast_overlay.dismiss_all()
-        self.toast_overlay.add_toast(Adw.Toast(timeout=3, title=(_("Change GNOME shell theme to 'Rewaita' and reboot for full changes"))))
-
-        color_pattern = r'--([a-z0-9-]+)\s*:\s*(#[a-fA-F0-9]+|[a-z0-9_-]+(?:\([^)]*\))?)\s*;'
-        references = defaultdict(list)
-        colors = dict()
-
-        for match in re.finditer(color_pattern, gtk_css):
-            name, value = match.groups()
-            if(value.startswith('@')):
-                ref_name = value[1:]
-                references[ref_name].append(name)
-            else:
-                colors[name] = value
-
-        for ref_name, dependent_names in references.items():
-            if(ref_name in colors):
-                for name in dependent_names:
-                    colors[name] = colors[ref_name]
-
-        accent_color, accent_fg = get_accent_color(colors, self)
-        colors["accent-color"] = accent_color
-        colors["accent-fg-color"] = accent_fg
-        extras = "\n" + extras + f"\n@define-color accent_bg_color {accent_color};\n@define-color accent_fg_color {accent_fg};"
-
-        try:
-            shutil.copy(theme_file, os.path.join(gtk4_config_dir, "gtk.css"))
-            with open(os.path.join(gtk4_config_dir, "gtk.css"), "a") as file:
-                file.write(extras)
-        except Exception as e:
-            print(f"Error moving file: {e}")
-
-        add_css_provider(open(theme_file).read() + extras, (accent_color, accent_fg))
-        parse_gtk_theme(
-            colors,
-            self.template_file_content,
-            os.path.join(os.path.dirname(os.path.abspath(__file__)), "gnome-shell-template.css"),
-            self.gtk3_template_file_content,
-            reset_shell
-        )
-        add_gtk3_window_controls(self.window_control, "")
+        add_css_provider(result["css"], result["accent"])
+        if(state["theme_name"] != "default"):
+            self.controls.set_css_classes([state["window_control"]])
+            self.toast_overlay.dismiss_all()
+            self.toast_overlay.add_toast(Adw.Toast(timeout=3, title=(_("Change GNOME shell theme to 'Rewaita' and reboot for full changes"))))
 
     def on_window_control_clicked(self, button, control_file, window, flowbox):
-        if(control_file != "default"):
-            self.window_control_css = open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "window-controls", "gtk4", f"{control_file}.css")).read()
-        else:
-            self.window_control_css = ""
         for control in flowbox:
             control_button = control.get_first_child()
             control_button.remove_css_class("active-scheme")
@@ -221,24 +140,17 @@ class RewaitaWindow(Adw.ApplicationWindow):
 
         if(theme_type == "light" and self.pref in [0, 2] or theme_type == "dark" and self.pref == 1):
             self.on_theme_selected()
+            update_auto_tint(self, Preferences().get_all(), self.pref)
         else:
             self.save_prefs()
+            update_auto_tint(self, Preferences().get_all(), self.pref) # Precomputes the other variant so the next flip is instant
             self.toast_overlay.dismiss_all()
             self.toast_overlay.add_toast(Adw.Toast(timeout=3, title=(_(f"{theme_type.capitalize()} theme set to: {theme_name.replace('.css', '')}"))))
 
         if(theme_type == "dark"):
-            flowbox_type = self.dark_flowbox
+            self.dark_grid.refresh()
         elif(theme_type == "light"):
-            flowbox_type = self.light_flowbox
-
-        for flowbox in flowbox_type:
-            for theme in flowbox:
-                theme.remove_css_class("active-scheme")
-
-        if(not button):
-            return
-        if(button.get_icon_name() != "reload-symbolic"):
-            button.add_css_class("active-scheme")
+            self.light_grid.refresh()
 
     def save_prefs(self):
         values = {
@@ -258,7 +170,9 @@ class RewaitaWindow(Adw.ApplicationWindow):
             "dark-panel": self.dark_panel,
             "trans-panel": self.trans_panel,
             "no-pills": self.no_pills,
-            "accent": self.accent
+            "accent": self.accent,
+            "auto-tint": self.auto_tint,
+            "tint-source": self.tint_source
         }
 
         prefs = Preferences()